@@ -3,24 +3,38 @@
 # ============================================
 
 from flask import Flask
-from database import init_db, test_connection
+from database import init_db_app
+from metrics import init_metrics, clear as clear_metrics
+from query_check import init_query_check
+from slow_queries import slow_query_log
+from migrate import check_schema
 from routes import init_routes
 import os
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 
-# Initialize database tables
-print("Initializing database...")
-init_db()
+# Schema migrations run once per deploy (python migrate.py); workers only
+# check the version
+print("Checking database schema...")
+check_schema()
 
-# Test connection
-print("Testing database connection...")
-test_connection()
+# Check out one pooled connection per request
+init_db_app(app)
+
+# Per-request latency, query counts and sizes for /metrics
+init_metrics(app)
+
+# Warn about N+1 queries and routes over their query budget
+init_query_check(app)
+
+# Log statements slower than SLOW_QUERY_MS, with sampled EXPLAIN plans
+slow_query_log.install()
 
 # Initialize routes
 init_routes(app)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
+    clear_metrics()
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,208 @@
+"""
+Bulk attendance import from CSV or XLSX muster rolls
+
+Two layouts are accepted, detected from the header row:
+
+    long:  employee_id, date, status            (one row per day)
+    wide:  employee_id, <date>, <date>, ...     (one row per employee,
+                                                 P/A or Present/Absent cells)
+
+Rows are streamed into a temporary staging table with COPY, unknown employee
+ids are found with a single anti-join, and the rest is merged into
+attendance with ON CONFLICT (employee_id, date).
+
+Usage:
+    python attendance_import.py muster_roll.xlsx
+"""
+
+import csv
+import io
+import sys
+import zipfile
+from datetime import date, datetime
+
+from database import get_db
+from models import bump_version
+
+STATUSES = {'present': 'Present', 'p': 'Present', 'absent': 'Absent', 'a': 'Absent'}
+
+def parse_date(value):
+    """Spreadsheet cell -> date; accepts dates and YYYY-MM-DD, DD-MM-YYYY
+    or DD/MM/YYYY text. Raises ValueError."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = str(value).strip()
+    for fmt in ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f'bad date {value!r}')
+
+def _parse_status(value):
+    status = STATUSES.get(str(value or '').strip().lower())
+    if status is None:
+        raise ValueError(f'bad status {value!r}')
+    return status
+
+def read_rows(fileobj, filename):
+    """Yield raw rows (lists of cell values) from a CSV or XLSX file object"""
+    if filename.lower().endswith('.xlsx'):
+        import openpyxl
+        from openpyxl.utils.exceptions import InvalidFileException
+        try:
+            wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+        except (zipfile.BadZipFile, KeyError, InvalidFileException) as e:
+            # Corrupt or mislabeled uploads: report them like any bad file
+            raise ValueError('not a valid .xlsx file') from e
+        try:
+            for row in wb.active.iter_rows(values_only=True):
+                yield list(row)
+        finally:
+            wb.close()
+    else:
+        text = fileobj if isinstance(fileobj, io.TextIOBase) else io.TextIOWrapper(
+            fileobj, encoding='utf-8-sig', newline='')
+        yield from csv.reader(text)
+
+def iter_records(rows, stats):
+    """Turn raw rows into (employee_id, date, status) records.
+
+    Unparseable rows and blank cells are counted in stats['rejected'] and
+    skipped.
+    """
+    rows = iter(rows)
+    header = next(rows, [])
+    names = [str(h or '').strip().lower() for h in header]
+    wide = names[:3] != ['employee_id', 'date', 'status']
+    # Parse the header eagerly so a bad layout fails before any database work
+    dates = [parse_date(h) if h else None for h in header[1:]] if wide else None
+    return _records(rows, wide, dates, stats)
+
+def _records(rows, wide, dates, stats):
+    for row in rows:
+        if not row or all(cell in (None, '') for cell in row):
+            continue
+        try:
+            employee_id = int(row[0])
+        except (TypeError, ValueError):
+            stats['rejected'] += 1
+            continue
+
+        if wide:
+            for day, cell in zip(dates, row[1:]):
+                if day is None or cell in (None, ''):
+                    continue
+                try:
+                    yield employee_id, day, _parse_status(cell)
+                except ValueError:
+                    stats['rejected'] += 1
+        else:
+            try:
+                yield employee_id, parse_date(row[1]), _parse_status(row[2])
+            except (IndexError, ValueError):
+                stats['rejected'] += 1
+
+class _CopyStream:
+    """File-like object that renders records as CSV for COPY ... FROM STDIN"""
+
+    def __init__(self, records, stats):
+        self._records = records
+        self._stats = stats
+        self._buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            record = next(self._records, None)
+            if record is None:
+                break
+            employee_id, day, status = record
+            self._stats['read'] += 1
+            self._buffer += f'{employee_id},{day.isoformat()},{status}\n'.encode()
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+def import_attendance(fileobj, filename):
+    """Load a muster roll into attendance in one transaction.
+
+    Raises ValueError if the header row is not a recognised layout.
+    Returns a stats dict, or None if the import failed.
+    """
+    stats = {'read': 0, 'rejected': 0, 'unknown_employee_ids': [], 'merged': 0}
+    records = iter_records(read_rows(fileobj, filename), stats)
+
+    conn = get_db()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            CREATE TEMP TABLE attendance_staging (
+                line BIGSERIAL,
+                employee_id INTEGER NOT NULL,
+                date DATE NOT NULL,
+                status VARCHAR(20) NOT NULL
+            ) ON COMMIT DROP
+        ''')
+        cursor.copy_expert(
+            'COPY attendance_staging (employee_id, date, status) FROM STDIN WITH (FORMAT csv)',
+            _CopyStream(records, stats)
+        )
+
+        cursor.execute('''
+            SELECT DISTINCT st.employee_id
+            FROM attendance_staging st
+            WHERE NOT EXISTS (SELECT 1 FROM employees e WHERE e.id = st.employee_id)
+            ORDER BY st.employee_id
+        ''')
+        stats['unknown_employee_ids'] = [row[0] for row in cursor.fetchall()]
+
+        # Last occurrence in the file wins when a day appears twice
+        cursor.execute('''
+            INSERT INTO attendance (employee_id, date, status)
+            SELECT DISTINCT ON (st.employee_id, st.date) st.employee_id, st.date, st.status
+            FROM attendance_staging st
+            WHERE st.employee_id <> ALL(%s::integer[])
+            ORDER BY st.employee_id, st.date, st.line DESC
+            ON CONFLICT (employee_id, date)
+            DO UPDATE SET status = EXCLUDED.status
+            WHERE attendance.status IS DISTINCT FROM EXCLUDED.status
+        ''', (stats['unknown_employee_ids'],))
+        stats['merged'] = cursor.rowcount
+
+        if stats['merged']:
+            bump_version(cursor, 'attendance')
+        conn.commit()
+        return stats
+    except Exception as e:
+        print("import_attendance error:", e)
+        conn.rollback()
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def main(argv):
+    if len(argv) != 2:
+        print(__doc__.strip())
+        return 1
+
+    path = argv[1]
+    print(f"🔄 Importing attendance from {path}...")
+    with open(path, 'rb') as f:
+        stats = import_attendance(f, path)
+    if stats is None:
+        print("❌ Import failed!")
+        return 1
+
+    print(f"✅ {stats['read']} rows read, {stats['merged']} merged, {stats['rejected']} rejected")
+    if stats['unknown_employee_ids']:
+        print(f"⚠️ Unknown employee ids skipped: {stats['unknown_employee_ids']}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,239 @@
+"""
+Optional in-process attendance index (set ATTENDANCE_INDEX=1 to enable)
+
+Holds one bitset per employee per year, one bit per day for Present, with a
+prefix popcount per 64-day word. Any present-day count over a date range is
+then two masked popcounts and a subtraction per year it spans. Weekly
+payroll totals and the attendance heatmap read from it.
+
+The index is warmed from one streaming scan and tagged with the attendance
+data version it reflects. Attendance.mark/mark_many apply their own writes
+when the version shows nobody else wrote in between; any other write
+(another worker, a bulk import, a cascading delete) changes the version and
+the next lookup starts a rewarm in a background thread. Lookups fall back to
+SQL until it finishes. Each request checks the version once.
+"""
+
+from array import array
+from datetime import date, timedelta
+import os
+import threading
+import time
+
+from flask import g, has_app_context
+
+from database import get_db, stream_query
+
+ENABLED = os.environ.get('ATTENDANCE_INDEX', '0') == '1'
+# Don't rewarm more often than this; lookups fall back to SQL meanwhile
+REWARM_INTERVAL = float(os.environ.get('ATTENDANCE_INDEX_REWARM_SECONDS', 30))
+WORDS = 6  # 6 x 64 bits covers 366 days
+
+def _popcount(x):
+    return bin(x).count('1')
+
+class YearBits:
+    """Present days of one employee in one calendar year"""
+
+    __slots__ = ('words', 'prefix')
+
+    def __init__(self):
+        self.words = array('Q', [0] * WORDS)
+        self.prefix = array('H', [0] * (WORDS + 1))
+
+    def set(self, day, present):
+        word, bit = divmod(day, 64)
+        if present:
+            self.words[word] |= 1 << bit
+        else:
+            self.words[word] &= ~(1 << bit)
+        self._reprefix(word)
+
+    def _reprefix(self, start=0):
+        for i in range(start, WORDS):
+            self.prefix[i + 1] = self.prefix[i] + _popcount(self.words[i])
+
+    def rank(self, day):
+        """Present days before ``day`` (0-based day of year)"""
+        word, bit = divmod(day, 64)
+        if word >= WORDS:
+            return self.prefix[WORDS]
+        return self.prefix[word] + _popcount(self.words[word] & ((1 << bit) - 1))
+
+    def is_set(self, day):
+        word, bit = divmod(day, 64)
+        return bool(self.words[word] >> bit & 1)
+
+def _day_of_year(day):
+    return day.toordinal() - date(day.year, 1, 1).toordinal()
+
+def _attendance_version():
+    conn = get_db()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT version FROM data_versions WHERE table_name = 'attendance'")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    except Exception as e:
+        print("attendance_index version error:", e)
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+class AttendanceIndex:
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.version = None
+        self._years = {}
+        self._lock = threading.Lock()
+        self._last_warm = 0.0
+        self._worker = None
+
+    def warm(self, version=None):
+        """Rebuild the index from one streaming scan of present days.
+
+        ``version`` is the attendance version read just before the call,
+        if the caller already has it.
+        """
+        started = time.monotonic()
+        # Read the version first: a write racing the scan leaves the index
+        # tagged older than it is, which only costs an extra rewarm
+        if version is None:
+            version = _attendance_version()
+        if version is None:
+            return False
+
+        years = {}
+        try:
+            for employee_id, day in stream_query(
+                    "SELECT employee_id, date FROM attendance WHERE status = 'Present'"):
+                bits = years.get((employee_id, day.year))
+                if bits is None:
+                    bits = years[(employee_id, day.year)] = YearBits()
+                word, bit = divmod(_day_of_year(day), 64)
+                bits.words[word] |= 1 << bit
+        except Exception as e:
+            print("attendance_index warm error:", e)
+            return False
+        for bits in years.values():
+            bits._reprefix()
+
+        with self._lock:
+            self._years = years
+            self.version = version
+            self._last_warm = time.monotonic()
+        print(f"✅ Attendance index warmed: {len(years)} employee-years "
+              f"in {time.monotonic() - started:.2f}s")
+        return True
+
+    def _ready(self):
+        """True if the index matches the database; otherwise starts a rewarm
+        if allowed and returns False so the caller uses SQL"""
+        if not self.enabled:
+            return False
+        if has_app_context() and 'attendance_version' in g:
+            version = g.attendance_version
+        else:
+            version = _attendance_version()
+            if has_app_context():
+                g.attendance_version = version
+        if version is None:
+            return False
+        if version == self.version:
+            return True
+        if time.monotonic() - self._last_warm >= REWARM_INTERVAL or self.version is None:
+            self._start_warm(version)
+        return False
+
+    def _start_warm(self, version):
+        """Rewarm in a background thread, unless one is already running"""
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            # Also throttles retries when a warm fails
+            self._last_warm = time.monotonic()
+            self._worker = threading.Thread(target=self.warm, args=(version,), daemon=True,
+                                            name='attendance-index-warm')
+            self._worker.start()
+
+    def apply(self, marks, version):
+        """Apply this process's own writes, committed as data ``version``.
+
+        ``marks`` is an iterable of (employee_id, date, status). Ignored
+        unless the index was exactly one version behind.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.version is None or version != self.version + 1:
+                return
+            for employee_id, day, status in marks:
+                day = _as_day(day)
+                bits = self._years.get((employee_id, day.year))
+                if bits is None:
+                    bits = self._years[(employee_id, day.year)] = YearBits()
+                bits.set(_day_of_year(day), status == 'Present')
+            self.version = version
+        if has_app_context():
+            g.attendance_version = version
+
+    def count(self, employee_id, start, end):
+        """Present days in [start, end] inclusive, or None if unavailable"""
+        if not self._ready():
+            return None
+        start, end = _as_day(start), _as_day(end)
+        total = 0
+        with self._lock:
+            for year in range(start.year, end.year + 1):
+                bits = self._years.get((employee_id, year))
+                if bits is not None:
+                    total += _count_year(bits, year, start, end)
+        return total
+
+    def counts(self, start, end):
+        """Present days in [start, end] inclusive for every employee with
+        any, as {employee_id: days}, or None if unavailable"""
+        if not self._ready():
+            return None
+        start, end = _as_day(start), _as_day(end)
+        totals = {}
+        with self._lock:
+            for (employee_id, year), bits in self._years.items():
+                if start.year <= year <= end.year:
+                    days = _count_year(bits, year, start, end)
+                    if days:
+                        totals[employee_id] = totals.get(employee_id, 0) + days
+        return totals
+
+    def heatmap(self, employee_id, year):
+        """Present dates and per-month counts for one year, or None"""
+        if not self._ready():
+            return None
+        with self._lock:
+            bits = self._years.get((employee_id, year)) or YearBits()
+            jan1 = date(year, 1, 1)
+            present = [jan1 + timedelta(days=d) for d in range(366)
+                       if bits.is_set(d) and (jan1 + timedelta(days=d)).year == year]
+        months = [0] * 12
+        for day in present:
+            months[day.month - 1] += 1
+        return {'employee_id': employee_id, 'year': year,
+                'present': [d.isoformat() for d in present],
+                'months': months, 'total': len(present)}
+
+def _count_year(bits, year, start, end):
+    first = _day_of_year(start) if year == start.year else 0
+    last = _day_of_year(end) if year == end.year else 365
+    if last < first:
+        return 0
+    return bits.rank(last + 1) - bits.rank(first)
+
+def _as_day(value):
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+attendance_index = AttendanceIndex(ENABLED)
@@ -0,0 +1,143 @@
+"""
+Request every page that declares a query budget and fail on N+1 patterns
+
+Each GET route decorated with @query_budget is requested through the Flask
+test client with QUERY_CHECK=strict, so a route that exceeds its budget or
+repeats one statement too often fails. Run it against a database with
+realistic data (several employees, sites and months) before deploying.
+
+With --post the form posts are checked too (marking and re-marking
+attendance for every employee, a muster-roll import, an advance and an
+export job). They write real rows dated --date, which are deleted again
+afterwards; only use --post against a development copy of the database.
+
+Usage:
+    python check_queries.py [--id N] [--post [--date YYYY-MM-DD]] [URL ...]
+
+URL arguments such as <emp_id> are filled with --id (default 1). Extra
+URLs are checked against the global repeat limit.
+"""
+
+import argparse
+import io
+import sys
+
+from flask import url_for
+
+POST_REASON = 'check_queries.py'
+
+def budgeted_urls(app, object_id):
+    urls = []
+    with app.test_request_context():
+        for rule in app.url_map.iter_rules():
+            view = app.view_functions[rule.endpoint]
+            if 'GET' not in rule.methods or not hasattr(view, 'query_budget'):
+                continue
+            urls.append(url_for(rule.endpoint, **{arg: object_id for arg in rule.arguments}))
+    return sorted(urls)
+
+def post_cases(employee_ids, day):
+    """(label, url, form data) for every budgeted write path.
+
+    Attendance is posted twice so both the insert and the update path
+    touch every employee.
+    """
+    muster = 'employee_id,date,status\n' + ''.join(
+        f'{emp_id},{day},Present\n' for emp_id in employee_ids)
+    return [
+        ('mark attendance', '/attendance',
+         {'date': day, **{f'status_{emp_id}': 'Present' for emp_id in employee_ids}}),
+        ('re-mark attendance', '/attendance',
+         {'date': day, **{f'status_{emp_id}': 'Absent' for emp_id in employee_ids}}),
+        ('import attendance', '/import_attendance',
+         {'file': (io.BytesIO(muster.encode()), 'muster.csv')}),
+        ('record advance', '/advance',
+         {'employee_id': employee_ids[0], 'date': day, 'amount': '1', 'reason': POST_REASON}),
+        ('queue export', '/export_jobs',
+         {'report': 'weekly', 'start_date': day, 'end_date': day, 'format': 'csv'}),
+    ]
+
+def cleanup(day):
+    """Delete the rows the POST cases wrote"""
+    from database import get_db
+    from models import bump_version
+
+    conn = get_db()
+    if not conn:
+        return False
+    cursor = conn.cursor()
+    try:
+        cursor.execute('DELETE FROM attendance WHERE date = %s', (day,))
+        cursor.execute('DELETE FROM advances WHERE date = %s AND reason = %s', (day, POST_REASON))
+        bump_version(cursor, 'attendance', 'advances')
+        conn.commit()
+        return True
+    except Exception as e:
+        print("check_queries cleanup error:", e)
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+        conn.close()
+
+def check(client, method, url, label=None, data=None):
+    import query_check
+
+    label = label or url
+    try:
+        if method == 'POST':
+            response = client.post(url, data=data, headers={'Accept': 'application/json'})
+        else:
+            response = client.get(url)
+    except query_check.QueryBudgetExceeded as e:
+        print(f"❌ {e}")
+        return False
+    except Exception as e:
+        print(f"❌ {method} {label}: {type(e).__name__}: {e}")
+        return False
+    if response.status_code >= 400:
+        print(f"❌ {method} {label}: HTTP {response.status_code}")
+        return False
+    print(f"✅ {method} {label}")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description='Check pages against their query budgets')
+    parser.add_argument('--id', type=int, default=1, help='value for URL arguments')
+    parser.add_argument('--post', action='store_true',
+                        help='also check form posts (writes and deletes test rows)')
+    parser.add_argument('--date', default='2099-01-01', help='date for rows written by --post')
+    parser.add_argument('urls', nargs='*', help='extra URLs to check')
+    args = parser.parse_args()
+
+    import query_check
+    from app import app
+    from models import Employee
+    query_check.MODE = 'strict'
+    app.testing = True
+    client = app.test_client()
+
+    failures = 0
+    for url in budgeted_urls(app, args.id) + args.urls:
+        failures += not check(client, 'GET', url)
+
+    if args.post:
+        employee_ids = [emp['id'] for emp in Employee.get_all()]
+        if not employee_ids:
+            print("❌ --post needs at least one employee")
+            return 1
+        try:
+            for label, url, data in post_cases(employee_ids, args.date):
+                failures += not check(client, 'POST', url, label, data)
+        finally:
+            if not cleanup(args.date):
+                print(f"❌ Could not delete the test rows dated {args.date}")
+
+    if failures:
+        print(f"❌ {failures} request(s) failed the query check")
+        return 1
+    print("✅ All requests within their query budgets")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,8 +3,14 @@
 # ============================================
 
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 from psycopg2.extras import RealDictCursor
+from flask import g, has_app_context
+import itertools
 import os
+import threading
+import time
 
 def get_db_config():
     """Get database configuration from environment"""
@@ -24,29 +30,302 @@ def get_db_config():
             'port': 5432
         }
 
+def get_pool_config():
+    """Get connection pool sizing from environment"""
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30))
+    }
+
+STREAM_ITERSIZE = int(os.environ.get('DB_STREAM_ITERSIZE', 2000))
+
+# ========================================
+# QUERY TRACING
+# ========================================
+
+_query_listeners = []
+_acquire_listeners = []
+
+def add_query_listener(func):
+    """Call func(sql, params, seconds) after every statement on a connection
+    opened by connect(), whether or not it succeeded"""
+    _query_listeners.append(func)
+
+def add_acquire_listener(func):
+    """Call func(seconds) after every connection checkout from the pool"""
+    _acquire_listeners.append(func)
+
+def _notify(listeners, *args):
+    for func in listeners:
+        try:
+            func(*args)
+        except Exception as e:
+            print("Query listener error:", e)
+
+_traced_cursors = {}
+
+def _traced(cursor_class):
+    """Subclass of cursor_class that reports each statement to the listeners"""
+    traced = _traced_cursors.get(cursor_class)
+    if traced is None:
+        class TracedCursor(cursor_class):
+            def execute(self, query, vars=None):
+                started = time.perf_counter()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    _notify(_query_listeners, query, vars, time.perf_counter() - started)
+
+            def executemany(self, query, vars_list):
+                started = time.perf_counter()
+                try:
+                    return super().executemany(query, vars_list)
+                finally:
+                    _notify(_query_listeners, query, None, time.perf_counter() - started)
+
+            def copy_expert(self, sql, file, size=8192):
+                started = time.perf_counter()
+                try:
+                    return super().copy_expert(sql, file, size)
+                finally:
+                    _notify(_query_listeners, sql, None, time.perf_counter() - started)
+
+        TracedCursor.__name__ = f'Traced{cursor_class.__name__}'
+        traced = _traced_cursors[cursor_class] = TracedCursor
+    return traced
+
+class TracedConnection(psycopg2.extensions.connection):
+    """Connection whose cursors, of any cursor_factory, are traced"""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _traced(factory)
+        return super().cursor(*args, **kwargs)
+
+def connect():
+    """Open a new raw PostgreSQL connection"""
+    config = get_db_config()
+    
+    if 'database_url' in config:
+        # Production - use DATABASE_URL
+        return psycopg2.connect(config['database_url'], connection_factory=TracedConnection)
+    else:
+        # Development - use individual params
+        return psycopg2.connect(
+            host=config['host'],
+            database=config['database'],
+            user=config['user'],
+            password=config['password'],
+            port=config.get('port', 5432),
+            connection_factory=TracedConnection
+        )
+
+def _checkout():
+    started = time.perf_counter()
+    conn = get_pool().getconn()
+    _notify(_acquire_listeners, time.perf_counter() - started)
+    return conn
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of PostgreSQL connections.
+
+    Up to ``pool_size`` connections are kept open between checkouts. When all
+    of them are busy, up to ``max_overflow`` extra connections are opened and
+    closed again on return. Beyond that, callers wait up to ``timeout``
+    seconds for a connection to be released.
+    """
+
+    def __init__(self, pool_size, max_overflow, timeout):
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self._idle = []
+        self._checked_out = 0
+        self._cond = threading.Condition()
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def getconn(self):
+        started = time.monotonic()
+        with self._cond:
+            while not self._idle and self._checked_out >= self.pool_size + self.max_overflow:
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    raise psycopg2.pool.PoolError("connection pool exhausted")
+                self._cond.wait(remaining)
+            conn = self._idle.pop() if self._idle else None
+            self._checked_out += 1
+            waited = time.monotonic() - started
+            self.wait_count += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        if conn is None or conn.closed:
+            try:
+                conn = connect()
+            except Exception:
+                with self._cond:
+                    self._checked_out -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def putconn(self, conn):
+        keep = False
+        if not conn.closed:
+            try:
+                conn.rollback()
+                keep = True
+            except Exception:
+                keep = False
+        with self._cond:
+            self._checked_out -= 1
+            if keep and len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                conn = None
+            self._cond.notify()
+        if conn is not None and not conn.closed:
+            conn.close()
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            if not conn.closed:
+                conn.close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'idle': len(self._idle),
+                'checked_out': self._checked_out,
+                'wait_count': self.wait_count,
+                'wait_total_seconds': self.wait_total,
+                'wait_max_seconds': self.wait_max
+            }
+
+class PooledConnection:
+    """Connection handed out by get_db().
+
+    Model methods call ``close()`` when they are done. Inside a Flask app
+    context that only discards uncommitted work, because the connection is
+    shared for the rest of the request and released in teardown. Outside an
+    app context it returns the connection to the pool.
+    """
+
+    def __init__(self, conn, request_scoped):
+        self._conn = conn
+        self._request_scoped = request_scoped
+        self._released = False
+        self._streams = 0
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._request_scoped:
+            # An open stream_query cursor lives in the current transaction;
+            # its own close() rolls back once the stream is done
+            if not self._conn.closed and not self._streams:
+                self._conn.rollback()
+        else:
+            self.release()
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            get_pool().putconn(self._conn)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(**get_pool_config())
+    return _pool
+
+def reset_pool(close_connections=True):
+    """Drop this process's pool so the next get_db() builds a fresh one.
+
+    In a forked child pass ``close_connections=False``: the inherited
+    sockets belong to the parent's sessions, and closing them from the
+    child would terminate those sessions.
+    """
+    global _pool, _pool_lock
+    pool, _pool = _pool, None
+    _pool_lock = threading.Lock()
+    if pool is not None and close_connections:
+        pool.closeall()
+
+def pool_stats():
+    """Pool occupancy and checkout wait times"""
+    return get_pool().stats()
+
 def get_db():
-    """Create database connection"""
+    """Get a pooled database connection (one per request inside Flask)"""
     try:
-        config = get_db_config()
-        
-        if 'database_url' in config:
-            # Production - use DATABASE_URL
-            conn = psycopg2.connect(config['database_url'])
-        else:
-            # Development - use individual params
-            conn = psycopg2.connect(
-                host=config['host'],
-                database=config['database'],
-                user=config['user'],
-                password=config['password'],
-                port=config.get('port', 5432)
-            )
-        
-        return conn
+        if has_app_context():
+            if 'db' not in g:
+                g.db = PooledConnection(_checkout(), request_scoped=True)
+            return g.db
+        return PooledConnection(_checkout(), request_scoped=False)
     except Exception as e:
         print(f"Error connecting to PostgreSQL: {e}")
         return None
 
+def close_db(exception=None):
+    """Return the request's connection to the pool"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        conn.release()
+
+def init_db_app(app):
+    """Register request-scoped connection handling on the Flask app"""
+    app.teardown_appcontext(close_db)
+
+_stream_ids = itertools.count(1)
+
+def stream_query(sql, params=None, itersize=None):
+    """Yield result rows as tuples from a named server-side cursor.
+
+    Rows are fetched from the server ``itersize`` at a time, so memory stays
+    flat however many rows the query returns. Inside a request the cursor
+    runs on the request's own connection, so an export never needs a
+    second pooled connection; model methods that close() that connection
+    meanwhile don't roll back the cursor's transaction until the stream is
+    exhausted or closed. A model method that commits mid-stream does end
+    it, and the next fetch raises.
+
+    Errors, including a failed checkout, propagate to the consumer: a
+    stream that stopped early must not pass for a complete result.
+    """
+    conn = get_db()
+    if conn is None:
+        raise psycopg2.OperationalError("could not get a database connection")
+
+    conn._streams += 1
+    try:
+        cursor = conn.cursor(name=f'stream_query_{next(_stream_ids)}')
+        cursor.itersize = itersize or STREAM_ITERSIZE
+        try:
+            cursor.execute(sql, params)
+            yield from cursor
+        finally:
+            cursor.close()
+    except Exception as e:
+        print("stream_query error:", e)
+        raise
+    finally:
+        conn._streams -= 1
+        conn.close()
+
 def dict_cursor(conn):
     """Get dictionary cursor"""
     return conn.cursor(cursor_factory=RealDictCursor)
@@ -62,64 +341,32 @@ def test_connection():
         print("❌ Database connection failed!")
         return False
 
-def init_db():
-    """Initialize database with tables"""
-    conn = get_db()
-    if not conn:
-        return False
-    
-    cursor = conn.cursor()
-    
-    try:
-        # Create employees table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS employees (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(100) NOT NULL,
-                role VARCHAR(100) NOT NULL,
-                daily_salary DECIMAL(10,2) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create attendance table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS attendance (
-                id SERIAL PRIMARY KEY,
-                employee_id INTEGER NOT NULL,
-                date DATE NOT NULL,
-                status VARCHAR(20) NOT NULL,
-                FOREIGN KEY (employee_id) REFERENCES employees (id) ON DELETE CASCADE,
-                UNIQUE(employee_id, date)
-            )
-        ''')
-        
-        # Create advances table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS advances (
-                id SERIAL PRIMARY KEY,
-                employee_id INTEGER NOT NULL,
-                date DATE NOT NULL,
-                amount DECIMAL(10,2) NOT NULL,
-                reason TEXT,
-                FOREIGN KEY (employee_id) REFERENCES employees (id) ON DELETE CASCADE
-            )
-        ''')
-        
-        # Create indexes
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_employee ON attendance(employee_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_advances_date ON advances(date)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_advances_employee ON advances(employee_id)')
-        
-        conn.commit()
-        print("✅ Database tables created successfully!")
-        return True
-        
-    except Exception as e:
-        print(f"Error creating tables: {e}")
-        conn.rollback()
-        return False
-    finally:
-        cursor.close()
-        conn.close()
+def rebuild_month_summary(cursor):
+    """Recompute employee_month_summary from attendance and advances.
+
+    Writers are blocked until the caller's transaction ends so no trigger
+    update can land between the recompute and the commit.
+    """
+    cursor.execute('LOCK TABLE attendance, advances IN SHARE MODE')
+    cursor.execute('DELETE FROM employee_month_summary')
+    cursor.execute('''
+        INSERT INTO employee_month_summary
+            (month, employee_id, present_days, absent_days, total_advance)
+        SELECT COALESCE(att.month, adv.month), COALESCE(att.employee_id, adv.employee_id),
+            COALESCE(att.present_days, 0), COALESCE(att.absent_days, 0),
+            COALESCE(adv.total_advance, 0)
+        FROM (
+            SELECT date_trunc('month', date)::date AS month, employee_id,
+                COUNT(*) FILTER (WHERE status = 'Present') AS present_days,
+                COUNT(*) FILTER (WHERE status = 'Absent') AS absent_days
+            FROM attendance
+            GROUP BY 1, 2
+        ) att
+        FULL JOIN (
+            SELECT date_trunc('month', date)::date AS month, employee_id,
+                SUM(amount) AS total_advance
+            FROM advances
+            GROUP BY 1, 2
+        ) adv ON adv.month = att.month AND adv.employee_id = att.employee_id
+    ''')
+    return cursor.rowcount
@@ -0,0 +1,157 @@
+"""
+Background export jobs
+
+Payroll data is loaded in the request (one query) and the render to
+PDF/XLSX/CSV runs in a process pool. Job status and finished files live on
+disk so any gunicorn worker can answer a poll or serve the download.
+"""
+
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'payroll_exports'))
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', 2))
+EXPORT_JOB_TTL = int(os.environ.get('EXPORT_JOB_TTL', 3600))
+
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    # spawn, not fork: children must not inherit the parent's pooled
+    # database sockets or Flask state.
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(
+                    max_workers=EXPORT_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+def _meta_path(job_id):
+    return os.path.join(EXPORT_DIR, f'{job_id}.json')
+
+def _write_meta(job_id, **fields):
+    path = _meta_path(job_id)
+    meta = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            meta = json.load(f)
+    meta.update(fields, updated_at=time.time())
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, path)
+
+def _render_job(job_id, result, fmt):
+    """Runs in a pool process: render result to disk and record the outcome"""
+    from payroll import RENDERERS
+    import metrics
+
+    spec = RENDERERS[fmt]
+    path = os.path.join(EXPORT_DIR, f'{job_id}.{spec.extension}')
+    _write_meta(job_id, status='running')
+    try:
+        started = time.perf_counter()
+        with open(f'{path}.part', 'wb') as output:
+            result.render(fmt, output=output)
+        metrics.observe('payroll_export_render_seconds', time.perf_counter() - started, format=fmt)
+        metrics.flush(force=True)
+        os.replace(f'{path}.part', path)
+        _write_meta(job_id, status='done', path=path)
+    except Exception as e:
+        print(f"Export job {job_id} failed: {e}")
+        _write_meta(job_id, status='failed', error=str(e))
+
+def submit(result, fmt):
+    """Queue a render of result and return the job id"""
+    from payroll import RENDERERS
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    cleanup_expired()
+
+    spec = RENDERERS[fmt]
+    job_id = uuid.uuid4().hex
+    _write_meta(job_id, status='pending', created_at=time.time(),
+                filename=f'{result.filename}.{spec.extension}', mimetype=spec.mimetype)
+    try:
+        future = _get_executor().submit(_render_job, job_id, result, fmt)
+    except BrokenProcessPool:
+        _discard_executor()
+        future = _get_executor().submit(_render_job, job_id, result, fmt)
+    future.add_done_callback(lambda f: _job_finished(job_id, f))
+    return job_id
+
+def _job_finished(job_id, future):
+    """Record jobs that never reached _render_job's own error handling:
+    a pool process that died (e.g. out of memory) or a cancelled job"""
+    try:
+        error = future.exception()
+    except CancelledError:
+        error = 'export was cancelled'
+    if error is None:
+        return
+    if isinstance(error, BrokenProcessPool):
+        _discard_executor()
+    print(f"Export job {job_id} failed: {error}")
+    _write_meta(job_id, status='failed', error=str(error) or type(error).__name__)
+
+def _discard_executor():
+    """Drop a broken pool so the next submit starts a fresh one"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def get_job(job_id):
+    """Job metadata, or None for unknown or malformed ids"""
+    if not _JOB_ID.match(job_id or ''):
+        return None
+    try:
+        with open(_meta_path(job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def cleanup_expired(ttl=None):
+    """Delete job files older than the TTL; returns how many were removed"""
+    ttl = EXPORT_JOB_TTL if ttl is None else ttl
+    cutoff = time.time() - ttl
+    removed = 0
+    try:
+        names = os.listdir(EXPORT_DIR)
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+def reset_after_fork():
+    """Forget a pool inherited across fork; its worker processes and
+    management thread belong to the parent"""
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+def shutdown():
+    """Stop the process pool (used on worker exit)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,45 @@
+"""
+Export renderers, imported on first use
+
+openpyxl and reportlab are large. Each format's module is only imported the
+first time something is rendered in it, so workers that never export never
+pay for them.
+"""
+
+import importlib
+
+COMPANY_NAME = 'SAVUNADRY CONSTRUCTION'
+
+class Renderer:
+    """An output format. ``func`` is a callable or a 'module:function' path
+    that is imported on first render."""
+
+    def __init__(self, func, mimetype, extension):
+        self._func = func
+        self.mimetype = mimetype
+        self.extension = extension
+
+    def render(self, result, **options):
+        if isinstance(self._func, str):
+            module, name = self._func.split(':')
+            self._func = getattr(importlib.import_module(module), name)
+        return self._func(result, **options)
+
+RENDERERS = {
+    'csv': Renderer('exports.payroll_csv:render_csv', 'text/csv', 'csv'),
+    'xlsx': Renderer('exports.payroll_xlsx:render_xlsx',
+                     'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'pdf': Renderer('exports.payroll_pdf:render_pdf', 'application/pdf', 'pdf')
+}
+
+def renderer(fmt, mimetype=None, extension=None):
+    """Register a function as the renderer for an output format"""
+    def register(func):
+        RENDERERS[fmt] = Renderer(func, mimetype, extension)
+        return func
+    return register
+
+def render_employee_report(report, output):
+    """Write an EmployeeReport PDF to a binary file object"""
+    from exports.employee_pdf import render_employee_report
+    render_employee_report(report, output)
@@ -0,0 +1,73 @@
+"""
+Employee salary report PDF
+"""
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_CENTER
+
+from exports import COMPANY_NAME
+
+def render_employee_report(report, output):
+    """Write an EmployeeReport as a one-page PDF"""
+    employee = report.employee
+    start_date, end_date = report.start_date, report.end_date
+    present_days = report.present_days
+    gross_salary = report.gross_salary
+    total_advance = report.total_advance
+    net_salary = report.net_salary
+    
+    doc = SimpleDocTemplate(output, pagesize=A4)
+    elements = []
+    styles = getSampleStyleSheet()
+    
+    # Title
+    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'],
+                                 fontSize=18, spaceAfter=10, alignment=TA_CENTER)
+    
+    elements.append(Paragraph(COMPANY_NAME, title_style))
+    elements.append(Paragraph('Employee Salary Report', styles['Heading2']))
+    elements.append(Spacer(1, 20))
+    
+    # Employee Details
+    emp_data = [
+        ['Employee Name:', employee['name']],
+        ['Employee ID:', str(employee['id'])],
+        ['Role:', employee['role']],
+        ['Daily Salary:', f"₹{employee['daily_salary']:.2f}"],
+        ['Period:', f"{start_date} to {end_date}"]
+    ]
+    
+    emp_table = Table(emp_data, colWidths=[2*inch, 4*inch])
+    emp_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0f0f0')),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements.append(emp_table)
+    elements.append(Spacer(1, 20))
+    
+    # Salary Summary
+    summary_data = [
+        ['Description', 'Amount'],
+        ['Present Days', str(present_days)],
+        ['Gross Salary', f"₹{gross_salary:.2f}"],
+        ['Total Advance', f"₹{total_advance:.2f}"],
+        ['Net Salary', f"₹{net_salary:.2f}"]
+    ]
+    
+    summary_table = Table(summary_data, colWidths=[3*inch, 3*inch])
+    summary_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4472C4')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#E7E6E6')),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements.append(summary_table)
+    
+    doc.build(elements)
@@ -0,0 +1,16 @@
+"""
+Payroll CSV export
+"""
+
+from io import TextIOWrapper
+import csv
+
+def render_csv(result, output):
+    text = TextIOWrapper(output, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text)
+    writer.writerow([header for header, _, _ in result.columns])
+    for row in result.rows:
+        writer.writerow(result.values(row))
+    writer.writerow(result.totals())
+    text.flush()
+    text.detach()
@@ -0,0 +1,57 @@
+"""
+Payroll PDF export
+"""
+
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib import colors
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_CENTER
+
+from exports import COMPANY_NAME
+
+# The monthly table is narrow enough for reportlab's automatic widths
+COLUMN_WIDTHS = {
+    'weekly': [0.6*inch, 1.5*inch, 1.2*inch, 0.8*inch, 1*inch, 1*inch, 1*inch, 1.2*inch],
+}
+
+def render_pdf(result, output):
+    doc = SimpleDocTemplate(output, pagesize=landscape(A4))
+    elements = []
+    styles = getSampleStyleSheet()
+
+    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'],
+                                 fontSize=18, spaceAfter=10, alignment=TA_CENTER)
+
+    elements.append(Paragraph(COMPANY_NAME, title_style))
+    elements.append(Paragraph(result.heading, styles['Heading2']))
+    if result.period_label:
+        elements.append(Paragraph(result.period_label, styles['Normal']))
+    elements.append(Spacer(1, 20))
+
+    columns = result.columns
+    data = [[header for header, _, _ in columns]]
+    def cells(values):
+        return [f"₹{value:.2f}" if is_money and value != '' else str(value)
+                for value, (_, _, is_money) in zip(values, columns)]
+
+    for row in result.rows:
+        data.append(cells(result.values(row)))
+    data.append(cells(result.totals()))
+
+    table = Table(data, colWidths=COLUMN_WIDTHS.get(result.kind))
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4472C4')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#E7E6E6')),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+
+    elements.append(table)
+    doc.build(elements)
@@ -0,0 +1,67 @@
+"""
+Payroll Excel export
+"""
+
+import openpyxl
+from openpyxl.utils import get_column_letter
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill, NamedStyle
+
+from exports import COMPANY_NAME
+
+def _add_named_styles(wb):
+    """Register the payroll sheet styles once per workbook"""
+    money = '₹#,##0.00'
+    header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
+    center = Alignment(horizontal='center')
+    styles = [
+        NamedStyle('payroll_title', font=Font(size=16, bold=True), alignment=center),
+        NamedStyle('payroll_heading', font=Font(size=12, bold=True), alignment=center),
+        NamedStyle('payroll_period', font=Font(size=10), alignment=center),
+        NamedStyle('payroll_header', font=Font(color='FFFFFF', bold=True), fill=header_fill,
+                   alignment=center),
+        NamedStyle('payroll_money', number_format=money),
+        NamedStyle('payroll_total', font=Font(bold=True)),
+        NamedStyle('payroll_total_money', font=Font(bold=True), number_format=money)
+    ]
+    for style in styles:
+        wb.add_named_style(style)
+
+def render_xlsx(result, output):
+    """Write-only workbook: rows are flushed to a temp file as they are
+    appended, so memory stays flat however many employees there are."""
+    columns = result.columns
+    last_col = get_column_letter(len(columns))
+
+    wb = openpyxl.Workbook(write_only=True)
+    _add_named_styles(wb)
+    ws = wb.create_sheet('Weekly Payroll' if result.kind == 'weekly' else 'Monthly Report')
+    for i in range(1, len(columns) + 1):
+        ws.column_dimensions[get_column_letter(i)].width = 15
+
+    def cell(value, style=None):
+        c = WriteOnlyCell(ws, value=value)
+        if style:
+            c.style = style
+        return c
+
+    titles = [(COMPANY_NAME, 'payroll_title'), (result.heading, 'payroll_heading')]
+    if result.period_label:
+        titles.append((result.period_label, 'payroll_period'))
+    for i, (text, style) in enumerate(titles, start=1):
+        ws.merged_cells.add(f'A{i}:{last_col}{i}')
+        ws.append([cell(text, style)])
+
+    ws.append([])
+    ws.append([cell(header, 'payroll_header') for header, _, _ in columns])
+
+    money_styles = ['payroll_money' if is_money else None for _, _, is_money in columns]
+    for row in result.rows:
+        ws.append([cell(value, style) if style else value
+                   for value, style in zip(result.values(row), money_styles)])
+
+    ws.append([])
+    ws.append([cell(value, 'payroll_total_money' if style else 'payroll_total')
+               for value, style in zip(result.totals(), money_styles)])
+
+    wb.save(output)
@@ -0,0 +1,45 @@
+"""
+Gunicorn configuration
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master (preload_app) and workers are
+forked from it, sharing its imported modules copy-on-write. Anything that
+holds sockets, threads or child processes is reset in each worker after
+fork.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = True
+
+def when_ready(server):
+    # The schema check at import used a pooled connection in the master;
+    # close it before any worker is forked
+    from database import reset_pool
+    import metrics
+    reset_pool()
+    # Start every deploy's counters from zero
+    metrics.clear()
+
+def post_fork(server, worker):
+    from database import reset_pool
+    import export_jobs
+    import metrics
+    from slow_queries import slow_query_log
+    reset_pool(close_connections=False)
+    export_jobs.reset_after_fork()
+    metrics.reset_after_fork()
+    slow_query_log.reset_after_fork()
+
+def worker_exit(server, worker):
+    from database import reset_pool
+    import export_jobs
+    import metrics
+    export_jobs.shutdown()
+    metrics.flush(force=True)
+    reset_pool()
@@ -0,0 +1,250 @@
+"""
+Request, database and export metrics in Prometheus text format
+
+Each process keeps its own counters and histograms in memory and
+periodically writes a snapshot to METRICS_DIR as ``<pid>-<token>.json``.
+``/metrics`` sums every snapshot in the directory, so any gunicorn worker
+reports the totals for all of them. Snapshots of workers that have exited
+are kept so counters never go backwards; the directory is wiped when the
+gunicorn master starts.
+
+Other workers' numbers can lag by up to METRICS_FLUSH_SECONDS.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from flask import g, has_request_context, request
+
+from database import add_acquire_listener, add_query_listener
+
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'payroll_metrics'))
+FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ACQUIRE_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+SIZE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760, 104857600)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'payroll_http_requests_total': (
+        'counter', 'Requests by endpoint, method and status', None),
+    'payroll_http_request_duration_seconds': (
+        'histogram', 'Request latency by endpoint', LATENCY_BUCKETS),
+    'payroll_http_response_size_bytes': (
+        'histogram', 'Response body size by endpoint, where known', SIZE_BUCKETS),
+    'payroll_db_queries_per_request': (
+        'histogram', 'SQL statements executed per request', QUERY_COUNT_BUCKETS),
+    'payroll_db_time_per_request_seconds': (
+        'histogram', 'Time spent in SQL statements per request', LATENCY_BUCKETS),
+    'payroll_db_acquire_seconds': (
+        'histogram', 'Time to check a connection out of the pool', ACQUIRE_BUCKETS),
+    'payroll_export_render_seconds': (
+        'histogram', 'Time to render a payroll export by format', LATENCY_BUCKETS),
+}
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_file_id = None
+_last_flush = 0.0
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def observe(name, value, **labels):
+    buckets = METRICS[name][2]
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+        index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+        hist[0][index] += 1
+        hist[1] += value
+        hist[2] += 1
+
+# ========================================
+# FILE-BACKED STORE
+# ========================================
+
+def _snapshot_path():
+    global _file_id
+    if _file_id is None:
+        _file_id = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+    return os.path.join(METRICS_DIR, f'{_file_id}.json')
+
+def flush(force=False):
+    """Write this process's snapshot, at most once per FLUSH_INTERVAL
+    unless forced"""
+    global _last_flush
+    # One writer at a time, so a stale snapshot never replaces a newer one
+    with _flush_lock:
+        now = time.monotonic()
+        with _lock:
+            if not force and now - _last_flush < FLUSH_INTERVAL:
+                return
+            _last_flush = now
+            snapshot = {
+                'counters': [[name, labels, value] for (name, labels), value in _counters.items()],
+                'histograms': [[name, labels, hist[0], hist[1], hist[2]]
+                               for (name, labels), hist in _histograms.items()]
+            }
+        tmp = None
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=METRICS_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp, _snapshot_path())
+        except OSError as e:
+            print("Metrics flush error:", e)
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
+
+def collect():
+    """Sum the snapshots of every process; returns (counters, histograms)"""
+    flush(force=True)
+    counters, histograms = {}, {}
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        names = []
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric, labels, value in snapshot.get('counters', []):
+            key = (metric, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for metric, labels, buckets, total, count in snapshot.get('histograms', []):
+            key = (metric, tuple(map(tuple, labels)))
+            hist = histograms.get(key)
+            if hist is None:
+                histograms[key] = [list(buckets), total, count]
+            else:
+                hist[0] = [a + b for a, b in zip(hist[0], buckets)]
+                hist[1] += total
+                hist[2] += count
+    return counters, histograms
+
+def clear():
+    """Delete every snapshot and forget this process's numbers"""
+    reset_after_fork()
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        return
+    for name in names:
+        try:
+            os.remove(os.path.join(METRICS_DIR, name))
+        except OSError:
+            pass
+
+def reset_after_fork():
+    """Drop numbers inherited from the parent and write to a new snapshot"""
+    global _lock, _flush_lock, _counters, _histograms, _file_id, _last_flush
+    _lock = threading.Lock()
+    _flush_lock = threading.Lock()
+    _counters, _histograms = {}, {}
+    _file_id = None
+    _last_flush = 0.0
+
+# ========================================
+# PROMETHEUS TEXT FORMAT
+# ========================================
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+               for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+def render():
+    """All metrics, summed across processes, in Prometheus text format"""
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+            continue
+        for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, n in zip(buckets + (float('inf'),), counts):
+                cumulative += n
+                le = (('le', _format_value(float(bound))),)
+                lines.append(f'{name}_bucket{_format_labels(labels + le)} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+# ========================================
+# FLASK INTEGRATION
+# ========================================
+
+def _on_query(sql, params, seconds):
+    if has_request_context() and 'query_count' in g:
+        g.query_count += 1
+        g.query_time += seconds
+
+def _on_acquire(seconds):
+    observe('payroll_db_acquire_seconds', seconds)
+
+def _before_request():
+    g.request_started = time.perf_counter()
+    g.query_count = 0
+    g.query_time = 0.0
+
+def _after_request(response):
+    if 'request_started' not in g:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    inc('payroll_http_requests_total', endpoint=endpoint, method=request.method,
+        status=response.status_code)
+    observe('payroll_http_request_duration_seconds',
+            time.perf_counter() - g.request_started, endpoint=endpoint)
+    observe('payroll_db_queries_per_request', g.query_count, endpoint=endpoint)
+    observe('payroll_db_time_per_request_seconds', g.query_time, endpoint=endpoint)
+    size = response.calculate_content_length()
+    if size is None and response.content_length is not None:
+        size = response.content_length
+    if size is not None:
+        observe('payroll_http_response_size_bytes', size, endpoint=endpoint)
+    flush()
+    return response
+
+def init_metrics(app):
+    """Record per-request metrics on the Flask app"""
+    add_query_listener(_on_query)
+    add_acquire_listener(_on_acquire)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
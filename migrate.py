@@ -0,0 +1,385 @@
+"""
+Versioned schema migrations
+
+Run once per deploy (e.g. as Render's pre-deploy command), not from worker
+startup:
+
+    python migrate.py            # apply pending migrations
+    python migrate.py --status   # show current and latest version
+
+Each migration runs in its own transaction and records its version in
+schema_version. Workers only call check_schema(), a single MAX(version) read.
+The first three migrations use IF NOT EXISTS throughout so databases created
+by the old init_db() and migrate_render.py are adopted as they are.
+"""
+
+import argparse
+import os
+import sys
+
+from database import get_db, rebuild_month_summary
+
+# Arbitrary key so two deploys never migrate at the same time
+LOCK_KEY = 7203114
+AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', '0') == '1'
+
+MIGRATIONS = []
+
+def migration(version, description):
+    """Register a function(cursor) as the migration to ``version``"""
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return register
+
+# ========================================
+# MIGRATIONS
+# ========================================
+
+@migration(1, 'employees, attendance, advances and data versions')
+def core_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS employees (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            role VARCHAR(100) NOT NULL,
+            daily_salary DECIMAL(10,2) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attendance (
+            id SERIAL PRIMARY KEY,
+            employee_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            FOREIGN KEY (employee_id) REFERENCES employees (id) ON DELETE CASCADE,
+            UNIQUE(employee_id, date)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS advances (
+            id SERIAL PRIMARY KEY,
+            employee_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            amount DECIMAL(10,2) NOT NULL,
+            reason TEXT,
+            FOREIGN KEY (employee_id) REFERENCES employees (id) ON DELETE CASCADE
+        )
+    ''')
+    # Bumped by model write methods
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            table_name VARCHAR(100) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_employee ON attendance(employee_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_advances_date ON advances(date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_advances_employee ON advances(employee_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_advances_date_id ON advances(date, id)')
+
+MATERIAL_CATEGORIES = [
+    ('Cement', 'Cement and binding materials'),
+    ('Steel', 'Steel rods, bars, and materials'),
+    ('Sand', 'River sand, M-sand'),
+    ('Bricks', 'Red bricks, concrete blocks'),
+    ('Aggregate', 'Stone chips, gravel'),
+    ('Paint', 'Interior and exterior paints'),
+    ('Plumbing', 'Pipes, fittings, sanitary'),
+    ('Electrical', 'Wires, switches, fittings'),
+    ('Wood', 'Timber, plywood, doors'),
+    ('Hardware', 'Nails, screws, tools'),
+    ('Other', 'Miscellaneous materials')
+]
+
+@migration(2, 'site management tables')
+def site_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sites (
+            id SERIAL PRIMARY KEY,
+            site_name VARCHAR(200) NOT NULL,
+            location VARCHAR(255) NOT NULL,
+            client_name VARCHAR(150),
+            start_date DATE,
+            end_date DATE,
+            status VARCHAR(50) DEFAULT 'Active',
+            total_budget DECIMAL(15,2),
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS site_workers (
+            id SERIAL PRIMARY KEY,
+            site_id INTEGER NOT NULL,
+            employee_id INTEGER NOT NULL,
+            assigned_date DATE NOT NULL,
+            removed_date DATE,
+            role_at_site VARCHAR(100),
+            is_active BOOLEAN DEFAULT TRUE,
+            FOREIGN KEY (site_id) REFERENCES sites(id) ON DELETE CASCADE,
+            FOREIGN KEY (employee_id) REFERENCES employees(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS material_categories (
+            id SERIAL PRIMARY KEY,
+            category_name VARCHAR(100) NOT NULL UNIQUE,
+            description TEXT
+        )
+    ''')
+    for cat_name, cat_desc in MATERIAL_CATEGORIES:
+        cursor.execute('''
+            INSERT INTO material_categories (category_name, description)
+            VALUES (%s, %s)
+            ON CONFLICT (category_name) DO NOTHING
+        ''', (cat_name, cat_desc))
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS site_materials (
+            id SERIAL PRIMARY KEY,
+            site_id INTEGER NOT NULL,
+            material_category_id INTEGER NOT NULL,
+            material_name VARCHAR(200) NOT NULL,
+            quantity DECIMAL(10,2) NOT NULL,
+            unit VARCHAR(50) NOT NULL,
+            rate_per_unit DECIMAL(10,2) NOT NULL,
+            total_cost DECIMAL(15,2) NOT NULL,
+            supplier_name VARCHAR(150),
+            sent_date DATE NOT NULL,
+            bill_number VARCHAR(100),
+            amount_paid DECIMAL(15,2) DEFAULT 0,
+            amount_balance DECIMAL(15,2),
+            payment_status VARCHAR(50) DEFAULT 'Pending',
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (site_id) REFERENCES sites(id) ON DELETE CASCADE,
+            FOREIGN KEY (material_category_id) REFERENCES material_categories(id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS material_payments (
+            id SERIAL PRIMARY KEY,
+            site_material_id INTEGER NOT NULL,
+            payment_date DATE NOT NULL,
+            amount DECIMAL(15,2) NOT NULL,
+            payment_mode VARCHAR(50),
+            reference_number VARCHAR(100),
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (site_material_id) REFERENCES site_materials(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS site_expenses (
+            id SERIAL PRIMARY KEY,
+            site_id INTEGER NOT NULL,
+            expense_date DATE NOT NULL,
+            expense_type VARCHAR(100) NOT NULL,
+            description TEXT,
+            amount DECIMAL(10,2) NOT NULL,
+            paid_to VARCHAR(150),
+            payment_mode VARCHAR(50),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (site_id) REFERENCES sites(id) ON DELETE CASCADE
+        )
+    ''')
+    indexes = [
+        "CREATE INDEX IF NOT EXISTS idx_site_workers_site ON site_workers(site_id)",
+        "CREATE INDEX IF NOT EXISTS idx_site_workers_employee ON site_workers(employee_id)",
+        "CREATE INDEX IF NOT EXISTS idx_site_materials_site ON site_materials(site_id)",
+        "CREATE INDEX IF NOT EXISTS idx_site_materials_date ON site_materials(sent_date)",
+        "CREATE INDEX IF NOT EXISTS idx_site_materials_status ON site_materials(payment_status)",
+        "CREATE INDEX IF NOT EXISTS idx_site_materials_unpaid ON site_materials(sent_date, id) WHERE payment_status IS DISTINCT FROM 'Paid'",
+        "CREATE INDEX IF NOT EXISTS idx_material_payments_material ON material_payments(site_material_id)",
+        "CREATE INDEX IF NOT EXISTS idx_site_expenses_site ON site_expenses(site_id)",
+        "CREATE INDEX IF NOT EXISTS idx_site_expenses_date ON site_expenses(expense_date)"
+    ]
+    for index_sql in indexes:
+        cursor.execute(index_sql)
+
+@migration(3, 'employee_month_summary rollup and its triggers')
+def month_summary(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS employee_month_summary (
+            month DATE NOT NULL,
+            employee_id INTEGER NOT NULL,
+            present_days INTEGER NOT NULL DEFAULT 0,
+            absent_days INTEGER NOT NULL DEFAULT 0,
+            total_advance DECIMAL(12,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, employee_id),
+            FOREIGN KEY (employee_id) REFERENCES employees (id) ON DELETE CASCADE
+        )
+    ''')
+    # The triggers fire on every write path, including bulk COPY imports
+    # and cascading deletes, in the writer's own transaction
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION employee_month_summary_attendance() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE employee_month_summary
+                SET present_days = present_days - (OLD.status = 'Present')::int,
+                    absent_days = absent_days - (OLD.status = 'Absent')::int
+                WHERE month = date_trunc('month', OLD.date)::date
+                  AND employee_id = OLD.employee_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO employee_month_summary (month, employee_id, present_days, absent_days)
+                VALUES (date_trunc('month', NEW.date)::date, NEW.employee_id,
+                        (NEW.status = 'Present')::int, (NEW.status = 'Absent')::int)
+                ON CONFLICT (month, employee_id) DO UPDATE
+                SET present_days = employee_month_summary.present_days + EXCLUDED.present_days,
+                    absent_days = employee_month_summary.absent_days + EXCLUDED.absent_days;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION employee_month_summary_advances() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE employee_month_summary
+                SET total_advance = total_advance - OLD.amount
+                WHERE month = date_trunc('month', OLD.date)::date
+                  AND employee_id = OLD.employee_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO employee_month_summary (month, employee_id, total_advance)
+                VALUES (date_trunc('month', NEW.date)::date, NEW.employee_id, NEW.amount)
+                ON CONFLICT (month, employee_id) DO UPDATE
+                SET total_advance = employee_month_summary.total_advance + EXCLUDED.total_advance;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute('DROP TRIGGER IF EXISTS attendance_month_summary ON attendance')
+    cursor.execute('''
+        CREATE TRIGGER attendance_month_summary
+        AFTER INSERT OR UPDATE OR DELETE ON attendance
+        FOR EACH ROW EXECUTE FUNCTION employee_month_summary_attendance()
+    ''')
+    cursor.execute('DROP TRIGGER IF EXISTS advances_month_summary ON advances')
+    cursor.execute('''
+        CREATE TRIGGER advances_month_summary
+        AFTER INSERT OR UPDATE OR DELETE ON advances
+        FOR EACH ROW EXECUTE FUNCTION employee_month_summary_advances()
+    ''')
+    rebuild_month_summary(cursor)
+
+# ========================================
+# RUNNER
+# ========================================
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+def _ensure_version_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def current_version():
+    """Highest applied migration, 0 for a fresh database, None on error"""
+    conn = get_db()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+        if not cursor.fetchone()[0]:
+            return 0
+        cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+        return cursor.fetchone()[0]
+    except Exception as e:
+        print("current_version error:", e)
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def upgrade():
+    """Apply pending migrations in order; returns the versions applied or None"""
+    conn = get_db()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    applied = []
+    try:
+        for version, description, func in MIGRATIONS:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', (LOCK_KEY,))
+            _ensure_version_table(cursor)
+            cursor.execute('SELECT 1 FROM schema_version WHERE version = %s', (version,))
+            if cursor.fetchone():
+                conn.rollback()
+                continue
+            print(f"🔄 Migration {version}: {description}...")
+            func(cursor)
+            cursor.execute('INSERT INTO schema_version (version, description) VALUES (%s, %s)',
+                           (version, description))
+            conn.commit()
+            applied.append(version)
+        return applied
+    except Exception as e:
+        print("Migration error:", e)
+        conn.rollback()
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def check_schema():
+    """Cheap startup check that the database is migrated.
+
+    Applies pending migrations only when AUTO_MIGRATE=1 (handy for local
+    development); otherwise just warns.
+    """
+    current = current_version()
+    if current is None:
+        print("❌ Database connection failed!")
+        return False
+    if current >= latest_version():
+        print(f"✅ Database schema at version {current}")
+        return True
+    if AUTO_MIGRATE:
+        return upgrade() is not None
+    print(f"⚠️ Database schema at version {current}, code expects {latest_version()}; "
+          "run python migrate.py")
+    return False
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply database schema migrations')
+    parser.add_argument('--status', action='store_true',
+                        help='show current and latest version without migrating')
+    args = parser.parse_args()
+
+    if args.status:
+        current = current_version()
+        if current is None:
+            print("❌ Database connection failed!")
+            return 1
+        print(f"Schema version {current}, latest {latest_version()}")
+        for version, description, _ in MIGRATIONS:
+            print(f"  {'✅' if version <= current else '⏳'} {version}: {description}")
+        return 0
+
+    print("🔄 Migrating database...")
+    applied = upgrade()
+    if applied is None:
+        print("❌ Migration failed!")
+        return 1
+    if applied:
+        print(f"✅ Applied migration(s) {', '.join(map(str, applied))}")
+    else:
+        print("✅ Database already up to date")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,77 @@
 from database import get_db, dict_cursor
-from database import get_db
-from datetime import datetime
-from psycopg2.extras import RealDictCursor
+from database import get_db, stream_query, rebuild_month_summary
+from attendance_index import attendance_index
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import json
+from psycopg2.extras import RealDictCursor, execute_values, register_default_json
+
+def bump_version(cursor, *tables):
+    """Bump the data version of each table inside the caller's transaction.
+
+    Returns the new versions keyed by table name. Rows are locked in name
+    order whatever order the caller lists them in, so two writers bumping
+    overlapping tables can't deadlock on data_versions.
+    """
+    cursor.execute(
+        '''INSERT INTO data_versions (table_name, version)
+           SELECT t, 1 FROM unnest(%s::text[]) AS t ORDER BY t
+           ON CONFLICT (table_name)
+           DO UPDATE SET version = data_versions.version + 1
+           RETURNING table_name, version''',
+        (sorted(set(tables)),)
+    )
+    return dict(cursor.fetchall())
+
+class DataVersion:
+    @staticmethod
+    def get(*tables):
+        """Current version of each table, in the order given"""
+        conn = get_db()
+        if not conn:
+            return None
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                'SELECT table_name, version FROM data_versions WHERE table_name = ANY(%s)',
+                (list(tables),)
+            )
+            versions = dict(cursor.fetchall())
+            return tuple(versions.get(t, 0) for t in tables)
+        except Exception as e:
+            print("DataVersion.get error:", e)
+            return None
+        finally:
+            cursor.close()
+            conn.close()
+
+PAGE_SIZE = 50
+
+def _keyset_page(rows, limit, after, before):
+    """Trim a LIMIT n+1 keyset fetch to n rows in display order.
+
+    Returns (rows, has_next, has_prev). Backward fetches come back in
+    ascending order and are reversed here.
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+        return rows, True, has_more
+    return rows, has_more, after is not None
+
+def _page_cursors(page, key):
+    rows, has_next, has_prev = page
+    return {
+        'rows': rows,
+        'next': key(rows[-1]) if rows and has_next else None,
+        'prev': key(rows[0]) if rows and has_prev else None
+    }
+
+def _parse_date_cursor(value):
+    day, row_id = value.rsplit('_', 1)
+    return _as_date(day), int(row_id)
 
 class Employee:
     @staticmethod
@@ -15,6 +85,7 @@ class Employee:
                 'INSERT INTO employees (name, role, daily_salary) VALUES (%s, %s, %s)',
                 (name, role, daily_salary)
             )
+            bump_version(cursor, 'employees')
             conn.commit()
             return True
         except Exception as e:
@@ -38,6 +109,32 @@ class Employee:
             cursor.close()
             conn.close()
     
+    @staticmethod
+    def get_page(after=None, before=None, limit=PAGE_SIZE):
+        """One page of employees, newest first, using an id keyset cursor.
+
+        Pass ``after`` (the page's ``next`` id) to go forward or ``before``
+        (the page's ``prev`` id) to go back.
+        """
+        conn = get_db()
+        if not conn:
+            return {'rows': [], 'next': None, 'prev': None}
+        cursor = dict_cursor(conn)
+        try:
+            if before is not None:
+                cursor.execute('SELECT * FROM employees WHERE id > %s ORDER BY id ASC LIMIT %s',
+                               (before, limit + 1))
+            elif after is not None:
+                cursor.execute('SELECT * FROM employees WHERE id < %s ORDER BY id DESC LIMIT %s',
+                               (after, limit + 1))
+            else:
+                cursor.execute('SELECT * FROM employees ORDER BY id DESC LIMIT %s', (limit + 1,))
+            page = _keyset_page(cursor.fetchall(), limit, after, before)
+            return _page_cursors(page, lambda row: row['id'])
+        finally:
+            cursor.close()
+            conn.close()
+    
     @staticmethod
     def get_by_id(emp_id):
         conn = get_db()
@@ -63,6 +160,7 @@ class Employee:
                 'UPDATE employees SET name = %s, role = %s, daily_salary = %s WHERE id = %s',
                 (name, role, daily_salary, emp_id)
             )
+            bump_version(cursor, 'employees')
             conn.commit()
             return True
         except Exception as e:
@@ -80,6 +178,7 @@ class Employee:
         cursor = conn.cursor()
         try:
             cursor.execute('DELETE FROM employees WHERE id = %s', (emp_id,))
+            bump_version(cursor, 'employees', 'attendance', 'advances', 'site_workers')
             conn.commit()
             return True
         except Exception as e:
@@ -118,7 +217,9 @@ class Attendance:
                    DO UPDATE SET status = EXCLUDED.status''',
                 (employee_id, date, status)
             )
+            versions = bump_version(cursor, 'attendance')
             conn.commit()
+            attendance_index.apply([(employee_id, date, status)], versions['attendance'])
             return True
         except Exception as e:
             print(f"Error: {e}")
@@ -127,6 +228,41 @@ class Attendance:
             cursor.close()
             conn.close()
     
+    @staticmethod
+    def mark_many(date, statuses):
+        """Upsert a whole day's register in one statement and one transaction.
+
+        ``statuses`` maps employee_id to status.
+        """
+        if not statuses:
+            return True
+        conn = get_db()
+        if not conn:
+            return False
+        cursor = conn.cursor()
+        try:
+            rows = [(employee_id, date, status) for employee_id, status in statuses.items()]
+            execute_values(
+                cursor,
+                '''INSERT INTO attendance (employee_id, date, status)
+                   VALUES %s
+                   ON CONFLICT (employee_id, date)
+                   DO UPDATE SET status = EXCLUDED.status''',
+                rows,
+                page_size=len(rows)
+            )
+            versions = bump_version(cursor, 'attendance')
+            conn.commit()
+            attendance_index.apply(rows, versions['attendance'])
+            return True
+        except Exception as e:
+            print(f"Error: {e}")
+            conn.rollback()
+            return False
+        finally:
+            cursor.close()
+            conn.close()
+    
     @staticmethod
     def get_by_date(date):
         conn = get_db()
@@ -148,6 +284,9 @@ class Attendance:
     
     @staticmethod
     def get_week_attendance(employee_id, start_date, end_date):
+        count = attendance_index.count(employee_id, start_date, end_date)
+        if count is not None:
+            return count
         conn = get_db()
         if not conn:
             return 0
@@ -166,6 +305,10 @@ class Attendance:
     
     @staticmethod
     def get_month_attendance(employee_id, month, year):
+        start, end = month_range(month, year)
+        count = attendance_index.count(employee_id, start, end - timedelta(days=1))
+        if count is not None:
+            return count
         conn = get_db()
         if not conn:
             return 0
@@ -175,16 +318,43 @@ class Attendance:
                 SELECT COUNT(*) 
                 FROM attendance
                 WHERE employee_id = %s 
-                AND EXTRACT(MONTH FROM date) = %s 
-                AND EXTRACT(YEAR FROM date) = %s
+                AND date >= %s AND date < %s
                 AND status = 'Present'
-            ''', (employee_id, month, year))
+            ''', (employee_id, start, end))
             result = cursor.fetchone()
             return result[0] if result else 0
         finally:
             cursor.close()
             conn.close()
 
+    @staticmethod
+    def get_year_heatmap(employee_id, year):
+        """Present dates and per-month counts for a calendar heatmap"""
+        heatmap = attendance_index.heatmap(employee_id, year)
+        if heatmap is not None:
+            return heatmap
+        conn = get_db()
+        if not conn:
+            return None
+        cursor = conn.cursor()
+        try:
+            start, end = date(year, 1, 1), date(year + 1, 1, 1)
+            cursor.execute('''
+                SELECT date FROM attendance
+                WHERE employee_id = %s AND date >= %s AND date < %s AND status = 'Present'
+                ORDER BY date
+            ''', (employee_id, start, end))
+            present = [row[0] for row in cursor.fetchall()]
+            months = [0] * 12
+            for day in present:
+                months[day.month - 1] += 1
+            return {'employee_id': employee_id, 'year': year,
+                    'present': [d.isoformat() for d in present],
+                    'months': months, 'total': len(present)}
+        finally:
+            cursor.close()
+            conn.close()
+
 class Advance:
     @staticmethod
     def create(employee_id, date, amount, reason):
@@ -197,6 +367,7 @@ class Advance:
                 'INSERT INTO advances (employee_id, date, amount, reason) VALUES (%s, %s, %s, %s)',
                 (employee_id, date, amount, reason)
             )
+            bump_version(cursor, 'advances')
             conn.commit()
             return True
         except Exception as e:
@@ -225,6 +396,50 @@ class Advance:
             cursor.close()
             conn.close()
     
+    @staticmethod
+    def get_page(after=None, before=None, limit=PAGE_SIZE):
+        """One page of advances, newest first, using a (date, id) keyset cursor.
+
+        Cursors are ``'YYYY-MM-DD_id'`` strings as returned in ``next`` and
+        ``prev``.
+        """
+        conn = get_db()
+        if not conn:
+            return {'rows': [], 'next': None, 'prev': None}
+        cursor = dict_cursor(conn)
+        try:
+            if before is not None:
+                cursor.execute('''
+                    SELECT a.*, e.name
+                    FROM advances a
+                    JOIN employees e ON a.employee_id = e.id
+                    WHERE (a.date, a.id) > (%s, %s)
+                    ORDER BY a.date ASC, a.id ASC
+                    LIMIT %s
+                ''', _parse_date_cursor(before) + (limit + 1,))
+            elif after is not None:
+                cursor.execute('''
+                    SELECT a.*, e.name
+                    FROM advances a
+                    JOIN employees e ON a.employee_id = e.id
+                    WHERE (a.date, a.id) < (%s, %s)
+                    ORDER BY a.date DESC, a.id DESC
+                    LIMIT %s
+                ''', _parse_date_cursor(after) + (limit + 1,))
+            else:
+                cursor.execute('''
+                    SELECT a.*, e.name
+                    FROM advances a
+                    JOIN employees e ON a.employee_id = e.id
+                    ORDER BY a.date DESC, a.id DESC
+                    LIMIT %s
+                ''', (limit + 1,))
+            page = _keyset_page(cursor.fetchall(), limit, after, before)
+            return _page_cursors(page, lambda row: f"{row['date']:%Y-%m-%d}_{row['id']}")
+        finally:
+            cursor.close()
+            conn.close()
+    
     @staticmethod
     def get_week_advance(employee_id, start_date, end_date):
         conn = get_db()
@@ -250,19 +465,62 @@ class Advance:
             return 0
         cursor = conn.cursor()
         try:
+            start, end = month_range(month, year)
             cursor.execute('''
                 SELECT COALESCE(SUM(amount), 0)
                 FROM advances
                 WHERE employee_id = %s 
-                AND EXTRACT(MONTH FROM date) = %s 
-                AND EXTRACT(YEAR FROM date) = %s
-            ''', (employee_id, month, year))
+                AND date >= %s AND date < %s
+            ''', (employee_id, start, end))
             result = cursor.fetchone()
             return float(result[0]) if result else 0
         finally:
             cursor.close()
             conn.close()
 
+_SITE_SUMMARY_SQL = '''
+    SELECT
+        s.*,
+        COALESCE(w.total_workers, 0) AS total_workers,
+        COALESCE(m.material_count, 0) AS material_count,
+        COALESCE(m.total_material_cost, 0) AS total_material_cost,
+        COALESCE(m.total_paid, 0) AS total_paid,
+        COALESCE(m.total_balance, 0) AS total_balance,
+        COALESCE(p.total_payments, 0) AS total_payments,
+        COALESCE(x.total_expenses, 0) AS total_expenses
+    FROM sites s
+    LEFT JOIN (
+        SELECT site_id, COUNT(DISTINCT employee_id) AS total_workers
+        FROM site_workers
+        WHERE site_id = ANY(%(ids)s) AND is_active = TRUE
+        GROUP BY site_id
+    ) w ON w.site_id = s.id
+    LEFT JOIN (
+        SELECT site_id,
+            COUNT(*) AS material_count,
+            SUM(total_cost) AS total_material_cost,
+            SUM(amount_paid) AS total_paid,
+            SUM(amount_balance) AS total_balance
+        FROM site_materials
+        WHERE site_id = ANY(%(ids)s)
+        GROUP BY site_id
+    ) m ON m.site_id = s.id
+    LEFT JOIN (
+        SELECT sm.site_id, SUM(mp.amount) AS total_payments
+        FROM material_payments mp
+        JOIN site_materials sm ON mp.site_material_id = sm.id
+        WHERE sm.site_id = ANY(%(ids)s)
+        GROUP BY sm.site_id
+    ) p ON p.site_id = s.id
+    LEFT JOIN (
+        SELECT site_id, SUM(amount) AS total_expenses
+        FROM site_expenses
+        WHERE site_id = ANY(%(ids)s)
+        GROUP BY site_id
+    ) x ON x.site_id = s.id
+    WHERE s.id = ANY(%(ids)s)
+'''
+
 class Site:
     @staticmethod
     def create(site_name, location, client_name, start_date, end_date, total_budget, notes):
@@ -279,6 +537,7 @@ class Site:
                 (site_name, location, client_name, start_date, end_date, total_budget, notes)
             )
             site_id = cursor.fetchone()[0]
+            bump_version(cursor, 'sites')
             conn.commit()
             return site_id
         except Exception as e:
@@ -344,6 +603,7 @@ class Site:
                    WHERE id = %s''',
                 (site_name, location, client_name, start_date, end_date, status, total_budget, notes, site_id)
             )
+            bump_version(cursor, 'sites')
             conn.commit()
             return True
         except Exception as e:
@@ -361,6 +621,7 @@ class Site:
         cursor = conn.cursor()
         try:
             cursor.execute('DELETE FROM sites WHERE id = %s', (site_id,))
+            bump_version(cursor, 'sites', 'site_workers', 'site_materials', 'material_payments', 'site_expenses')
             conn.commit()
             return True
         except Exception as e:
@@ -372,26 +633,116 @@ class Site:
     
     @staticmethod
     def get_summary(site_id):
+        return Site.get_summaries([site_id]).get(site_id)
+    
+    @staticmethod
+    def get_summaries(site_ids):
+        """Summaries for many sites in one query, keyed by site id.
+
+        Workers, materials, payments and expenses are each aggregated on
+        their own before joining to sites, so no child table multiplies
+        another and the cost stays linear in the size of each site.
+        """
+        site_ids = list(site_ids)
+        if not site_ids:
+            return {}
         conn = get_db()
         if not conn:
-            return None
+            return {}
         cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute(_SITE_SUMMARY_SQL, {'ids': site_ids})
+            return {row['id']: row for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+            conn.close()
+
+@dataclass
+class SiteBundle:
+    """Everything the site detail and site report pages show"""
+    site: dict
+    workers: list
+    materials: list
+    material_summary: dict
+    expenses: list
+
+    @property
+    def total_material_cost(self):
+        return self.site['total_material_cost']
+
+    @property
+    def total_material_paid(self):
+        return self.site['total_paid']
+
+    @property
+    def total_material_balance(self):
+        return self.site['total_balance']
+
+    @property
+    def total_expenses(self):
+        return self.site['total_expenses']
+
+class SiteAggregate:
+    @staticmethod
+    def load(site_id):
+        """Load a SiteBundle in one round trip using JSON aggregation.
+
+        Returns None when the site does not exist.
+        """
+        conn = get_db()
+        if not conn:
+            return None
+        cursor = conn.cursor()
+        # Keep money as Decimal, as the rest of the models return it
+        register_default_json(cursor, loads=lambda s: json.loads(s, parse_float=Decimal))
         try:
             cursor.execute('''
-                SELECT 
-                    s.*,
-                    COUNT(DISTINCT sw.employee_id) as total_workers,
-                    COALESCE(SUM(sm.total_cost), 0) as total_material_cost,
-                    COALESCE(SUM(sm.amount_paid), 0) as total_paid,
-                    COALESCE(SUM(sm.amount_balance), 0) as total_balance
-                FROM sites s
-                LEFT JOIN site_workers sw ON s.id = sw.site_id AND sw.is_active = TRUE
-                LEFT JOIN site_materials sm ON s.id = sm.site_id
-                WHERE s.id = %s
-                GROUP BY s.id
-            ''', (site_id,))
-            summary = cursor.fetchone()
-            return summary
+                SELECT
+                    (SELECT row_to_json(summary) FROM (''' + _SITE_SUMMARY_SQL + ''') summary) AS site,
+                    (SELECT COALESCE(json_agg(w ORDER BY w.assigned_date DESC), '[]')
+                     FROM (
+                        SELECT sw.*, e.name, e.role AS employee_role, e.daily_salary
+                        FROM site_workers sw
+                        JOIN employees e ON sw.employee_id = e.id
+                        WHERE sw.site_id = %(id)s AND sw.is_active = TRUE
+                     ) w) AS workers,
+                    (SELECT COALESCE(json_agg(m ORDER BY m.sent_date DESC), '[]')
+                     FROM (
+                        SELECT sm.*, mc.category_name
+                        FROM site_materials sm
+                        JOIN material_categories mc ON sm.material_category_id = mc.id
+                        WHERE sm.site_id = %(id)s
+                     ) m) AS materials,
+                    (SELECT COALESCE(json_agg(c ORDER BY c.category_name), '[]')
+                     FROM (
+                        SELECT mc.category_name,
+                            COUNT(*) AS count,
+                            SUM(sm.total_cost) AS total_cost,
+                            SUM(sm.amount_paid) AS total_paid,
+                            SUM(sm.amount_balance) AS total_balance
+                        FROM site_materials sm
+                        JOIN material_categories mc ON sm.material_category_id = mc.id
+                        WHERE sm.site_id = %(id)s
+                        GROUP BY mc.category_name
+                     ) c) AS material_summary,
+                    (SELECT COALESCE(json_agg(x ORDER BY x.expense_date DESC), '[]')
+                     FROM (
+                        SELECT id, expense_date, expense_type, description,
+                            amount, paid_to, payment_mode
+                        FROM site_expenses
+                        WHERE site_id = %(id)s
+                        ORDER BY expense_date DESC
+                        LIMIT 50
+                     ) x) AS expenses
+            ''', {'ids': [site_id], 'id': site_id})
+            site, workers, materials, categories, expenses = cursor.fetchone()
+            if site is None:
+                return None
+            material_summary = {c.pop('category_name'): c for c in categories}
+            return SiteBundle(site, workers, materials, material_summary, expenses)
+        except Exception as e:
+            print("SiteAggregate.load error:", e)
+            return None
         finally:
             cursor.close()
             conn.close()
@@ -409,6 +760,7 @@ class SiteWorker:
                    VALUES (%s, %s, %s, %s)''',
                 (site_id, employee_id, assigned_date, role_at_site)
             )
+            bump_version(cursor, 'site_workers')
             conn.commit()
             return True
         except Exception as e:
@@ -431,6 +783,7 @@ class SiteWorker:
                    WHERE id = %s''',
                 (removed_date, site_worker_id)
             )
+            bump_version(cursor, 'site_workers')
             conn.commit()
             return True
         except Exception as e:
@@ -497,6 +850,7 @@ class SiteMaterial:
                  total_cost, notes)
             )
             material_id = cursor.fetchone()[0]
+            bump_version(cursor, 'site_materials')
             conn.commit()
             return material_id
         except Exception as e:
@@ -548,44 +902,92 @@ class SiteMaterial:
             conn.close()
     
     @staticmethod
-    def get_pending_payments(site_id=None):
+    def get_pending_payments(site_id=None, after=None, before=None, limit=PAGE_SIZE):
+        """One page of unpaid bills, newest first, using a (sent_date, id) cursor.
+
+        The ``IS DISTINCT FROM 'Paid'`` predicate matches the partial index
+        idx_site_materials_unpaid, so only unpaid rows are ever read.
+        """
+        after_key = _parse_date_cursor(after) if after is not None else None
+        before_key = _parse_date_cursor(before) if before is not None else None
         conn = get_db()
         if not conn:
-            return []
+            return {'rows': [], 'next': None, 'prev': None}
 
         cursor = conn.cursor(cursor_factory=RealDictCursor)
 
         try:
+            conditions = ["sm.payment_status IS DISTINCT FROM 'Paid'"]
+            params = []
             if site_id:
-                cursor.execute("""
-                    SELECT sm.*, mc.category_name, s.site_name
-                    FROM site_materials sm
-                    JOIN material_categories mc ON sm.material_category_id = mc.id
-                    JOIN sites s ON sm.site_id = s.id
-                    WHERE sm.site_id = %s
-                    AND (sm.payment_status IS NULL OR sm.payment_status <> 'Paid')
-                    ORDER BY sm.sent_date DESC
-                """, (site_id,))
+                conditions.append("sm.site_id = %s")
+                params.append(site_id)
+            if before is not None:
+                conditions.append("(sm.sent_date, sm.id) > (%s, %s)")
+                params.extend(before_key)
+                order = "ASC"
             else:
-                cursor.execute("""
-                    SELECT sm.*, mc.category_name, s.site_name
-                    FROM site_materials sm
-                    JOIN material_categories mc ON sm.material_category_id = mc.id
-                    JOIN sites s ON sm.site_id = s.id
-                    WHERE (sm.payment_status IS NULL OR sm.payment_status <> 'Paid')
-                    ORDER BY sm.sent_date DESC
-                """)
+                if after is not None:
+                    conditions.append("(sm.sent_date, sm.id) < (%s, %s)")
+                    params.extend(after_key)
+                order = "DESC"
 
-            return cursor.fetchall()
+            cursor.execute(f"""
+                SELECT sm.*, mc.category_name, s.site_name
+                FROM site_materials sm
+                JOIN material_categories mc ON sm.material_category_id = mc.id
+                JOIN sites s ON sm.site_id = s.id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY sm.sent_date {order}, sm.id {order}
+                LIMIT %s
+            """, params + [limit + 1])
+
+            page = _keyset_page(cursor.fetchall(), limit, after, before)
+            return _page_cursors(page, lambda row: f"{row['sent_date']:%Y-%m-%d}_{row['id']}")
 
         except Exception as e:
             print("get_pending_payments error:", e)
-            return []
+            return {'rows': [], 'next': None, 'prev': None}
 
         finally:
             cursor.close()
             conn.close()
 
+    @staticmethod
+    def get_outstanding_summary():
+        """Outstanding balance per supplier and per site from one grouped query"""
+        conn = get_db()
+        if not conn:
+            return {'by_supplier': [], 'by_site': []}
+
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute("""
+                SELECT
+                    GROUPING(sm.supplier_name) = 0 AS is_supplier,
+                    sm.supplier_name,
+                    s.id AS site_id,
+                    s.site_name,
+                    COUNT(*) AS bills,
+                    COALESCE(SUM(sm.amount_balance), 0) AS outstanding
+                FROM site_materials sm
+                JOIN sites s ON sm.site_id = s.id
+                WHERE sm.payment_status IS DISTINCT FROM 'Paid'
+                GROUP BY GROUPING SETS ((sm.supplier_name), (s.id, s.site_name))
+                ORDER BY outstanding DESC
+            """)
+            rows = cursor.fetchall()
+            return {
+                'by_supplier': [r for r in rows if r['is_supplier']],
+                'by_site': [r for r in rows if not r['is_supplier']]
+            }
+        except Exception as e:
+            print("get_outstanding_summary error:", e)
+            return {'by_supplier': [], 'by_site': []}
+        finally:
+            cursor.close()
+            conn.close()
+
 
 class MaterialPayment:
     @staticmethod
@@ -596,31 +998,33 @@ class MaterialPayment:
 
         cursor = conn.cursor()
         try:
+            # Apply the payment as a delta. The UPDATE takes the row lock on
+            # the bill first, so concurrent payments against it queue up and
+            # each one adds to the latest committed amount_paid.
             cursor.execute("""
-                INSERT INTO material_payments
-                (site_material_id, payment_date, amount, payment_mode, reference_number, notes)
-                VALUES (%s,%s,%s,%s,%s,%s)
-            """, (site_material_id, payment_date, amount, payment_mode, reference_number, notes))
-
-            cursor.execute("""
-                WITH total AS (
-                    SELECT COALESCE(SUM(amount),0) AS paid
-                    FROM material_payments
-                    WHERE site_material_id = %s
-                )
                 UPDATE site_materials
                 SET
-                    amount_paid = total.paid,
-                    amount_balance = total_cost - total.paid,
+                    amount_paid = COALESCE(amount_paid, 0) + %(amount)s,
+                    amount_balance = total_cost - (COALESCE(amount_paid, 0) + %(amount)s),
                     payment_status = CASE
-                        WHEN total.paid = 0 THEN 'Pending'
-                        WHEN total.paid < total_cost THEN 'Partial'
+                        WHEN COALESCE(amount_paid, 0) + %(amount)s = 0 THEN 'Pending'
+                        WHEN COALESCE(amount_paid, 0) + %(amount)s < total_cost THEN 'Partial'
                         ELSE 'Paid'
                     END
-                FROM total
-                WHERE id = %s
-            """, (site_material_id, site_material_id))
+                WHERE id = %(id)s
+                RETURNING id
+            """, {'amount': amount, 'id': site_material_id})
+            if cursor.fetchone() is None:
+                conn.rollback()
+                return False
 
+            cursor.execute("""
+                INSERT INTO material_payments
+                (site_material_id, payment_date, amount, payment_mode, reference_number, notes)
+                VALUES (%s,%s,%s,%s,%s,%s)
+            """, (site_material_id, payment_date, amount, payment_mode, reference_number, notes))
+
+            bump_version(cursor, 'material_payments', 'site_materials')
             conn.commit()
             return True
 
@@ -654,6 +1058,86 @@ class MaterialPayment:
             cursor.close()
             conn.close()
 
+    @staticmethod
+    def reconcile(apply=False):
+        """Recompute every bill's paid amount, balance and status from its payments.
+
+        Returns the bills whose stored figures drifted from the payment
+        history. With ``apply=True`` the drifted rows are corrected in the
+        same statement.
+        """
+        conn = get_db()
+        if not conn:
+            return None
+
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            drift_sql = """
+                WITH totals AS (
+                    SELECT sm.id, sm.total_cost, COALESCE(p.paid, 0) AS paid
+                    FROM site_materials sm
+                    LEFT JOIN (
+                        SELECT site_material_id, SUM(amount) AS paid
+                        FROM material_payments
+                        GROUP BY site_material_id
+                    ) p ON p.site_material_id = sm.id
+                ),
+                expected AS (
+                    SELECT id, paid, total_cost - paid AS balance,
+                        CASE
+                            WHEN paid = 0 THEN 'Pending'
+                            WHEN paid < total_cost THEN 'Partial'
+                            ELSE 'Paid'
+                        END AS status
+                    FROM totals
+                ),
+                drift AS (
+                    SELECT sm.id, sm.amount_paid AS stored_paid, e.paid AS expected_paid,
+                        sm.amount_balance AS stored_balance, e.balance AS expected_balance,
+                        sm.payment_status AS stored_status, e.status AS expected_status
+                    FROM site_materials sm
+                    JOIN expected e ON e.id = sm.id
+                    WHERE sm.amount_paid IS DISTINCT FROM e.paid
+                       OR sm.amount_balance IS DISTINCT FROM e.balance
+                       OR sm.payment_status IS DISTINCT FROM e.status
+                )
+            """
+            if apply:
+                # Block payments and bill edits until commit, so the drift is
+                # computed from the same state the UPDATE overwrites. Locked in
+                # the order MaterialPayment.create writes them to avoid
+                # deadlocks; SHARE ROW EXCLUSIVE also serializes reconciles.
+                cursor.execute('LOCK TABLE site_materials IN SHARE ROW EXCLUSIVE MODE')
+                cursor.execute('LOCK TABLE material_payments IN SHARE MODE')
+                cursor.execute(drift_sql + """
+                    , fixed AS (
+                        UPDATE site_materials sm
+                        SET amount_paid = d.expected_paid,
+                            amount_balance = d.expected_balance,
+                            payment_status = d.expected_status
+                        FROM drift d
+                        WHERE sm.id = d.id
+                        RETURNING sm.id
+                    )
+                    SELECT * FROM drift ORDER BY id
+                """)
+                drifted = cursor.fetchall()
+                if drifted:
+                    bump_version(cursor, 'site_materials')
+                conn.commit()
+            else:
+                cursor.execute(drift_sql + " SELECT * FROM drift ORDER BY id")
+                drifted = cursor.fetchall()
+            return drifted
+
+        except Exception as e:
+            print("MaterialPayment.reconcile error:", e)
+            conn.rollback()
+            return None
+        finally:
+            cursor.close()
+            conn.close()
+
 
 class SiteExpense:
     @staticmethod
@@ -670,6 +1154,7 @@ class SiteExpense:
                 VALUES (%s,%s,%s,%s,%s,%s,%s)
             """, (site_id, expense_date, expense_type, description, amount, paid_to, payment_mode))
 
+            bump_version(cursor, 'site_expenses')
             conn.commit()
             return True
         except Exception as e:
@@ -712,4 +1197,337 @@ class SiteExpense:
             return []
         finally:
             cursor.close()
-            conn.close()
\ No newline at end of file
+            conn.close()
+
+
+def month_range(month, year):
+    """Half-open [start, end) date range for a calendar month.
+
+    Filtering on ``date >= start AND date < end`` lets Postgres use the date
+    indexes, which ``EXTRACT(MONTH FROM date)`` cannot.
+    """
+    month, year = int(month), int(year)
+    start = date(year, month, 1)
+    if month == 12:
+        end = date(year + 1, 1, 1)
+    else:
+        end = date(year, month + 1, 1)
+    return start, end
+
+
+def _as_date(value):
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+_RANGE_TOTALS_SQL = '''
+    SELECT {employee_columns},
+        COALESCE(att.present_days, 0) AS present_days,
+        COALESCE(adv.total_advance, 0) AS total_advance
+    FROM employees e
+    LEFT JOIN (
+        SELECT employee_id, COUNT(*) AS present_days
+        FROM attendance
+        WHERE date >= %s AND date < %s AND status = 'Present'
+        GROUP BY employee_id
+    ) att ON att.employee_id = e.id
+    LEFT JOIN (
+        SELECT employee_id, SUM(amount) AS total_advance
+        FROM advances
+        WHERE date >= %s AND date < %s
+        GROUP BY employee_id
+    ) adv ON adv.employee_id = e.id
+    ORDER BY e.id DESC
+'''
+
+# _RANGE_TOTALS_SQL without attendance, for when the index has the counts
+_RANGE_ADVANCES_SQL = '''
+    SELECT e.*, COALESCE(adv.total_advance, 0) AS total_advance
+    FROM employees e
+    LEFT JOIN (
+        SELECT employee_id, SUM(amount) AS total_advance
+        FROM advances
+        WHERE date >= %s AND date < %s
+        GROUP BY employee_id
+    ) adv ON adv.employee_id = e.id
+    ORDER BY e.id DESC
+'''
+
+_MONTH_TOTALS_SQL = '''
+    SELECT {employee_columns},
+        COALESCE(s.present_days, 0) AS present_days,
+        COALESCE(s.total_advance, 0) AS total_advance
+    FROM employees e
+    LEFT JOIN employee_month_summary s ON s.employee_id = e.id AND s.month = %s
+    ORDER BY e.id DESC
+'''
+
+class PayrollEngine:
+    @staticmethod
+    def get_period_totals(start_date, end_date):
+        """Present days and advance totals for every employee, end date inclusive.
+
+        Present days come from the attendance index when it is enabled and
+        current, otherwise from the same query as the advances.
+        """
+        start, end = _as_date(start_date), _as_date(end_date)
+        present = attendance_index.counts(start, end)
+        if present is not None:
+            return PayrollEngine._indexed_range_totals(start, end + timedelta(days=1), present)
+        return PayrollEngine._range_totals(start, end + timedelta(days=1))
+
+    @staticmethod
+    def get_month_totals(month, year):
+        """Present days and advance totals for every employee in a month.
+
+        Read from employee_month_summary, so the cost is one primary-key
+        range read however much history there is. Raises on database errors
+        so a failed read is never cached as an empty payroll.
+        """
+        conn = get_db()
+        if not conn:
+            raise ConnectionError("Error connecting to PostgreSQL")
+
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute(_MONTH_TOTALS_SQL.format(employee_columns='e.*'),
+                           (month_range(month, year)[0],))
+            return cursor.fetchall()
+        except Exception as e:
+            print("PayrollEngine.get_month_totals error:", e)
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def iter_period_totals(start_date, end_date):
+        """Like get_period_totals, streamed one employee at a time."""
+        end_exclusive = _as_date(end_date) + timedelta(days=1)
+        return PayrollEngine._iter_range_totals(_as_date(start_date), end_exclusive)
+
+    @staticmethod
+    def iter_month_totals(month, year):
+        """Like get_month_totals, streamed one employee at a time."""
+        columns = ('id', 'name', 'role', 'daily_salary', 'present_days', 'total_advance')
+        sql = _MONTH_TOTALS_SQL.format(employee_columns='e.id, e.name, e.role, e.daily_salary')
+        for row in stream_query(sql, (month_range(month, year)[0],)):
+            yield dict(zip(columns, row))
+
+    @staticmethod
+    def _iter_range_totals(start, end):
+        """Yield _range_totals rows from a server-side cursor.
+
+        Only the columns the exports use are selected, and each tuple is
+        turned into a dict as it is read.
+        """
+        columns = ('id', 'name', 'role', 'daily_salary', 'present_days', 'total_advance')
+        sql = _RANGE_TOTALS_SQL.format(employee_columns='e.id, e.name, e.role, e.daily_salary')
+        for row in stream_query(sql, (start, end, start, end)):
+            yield dict(zip(columns, row))
+
+    @staticmethod
+    def _range_totals(start, end):
+        """Aggregate attendance and advances over [start, end) in one query.
+
+        Attendance and advances are aggregated separately before being joined
+        to employees so neither side multiplies the other. Raises on database
+        errors, like get_month_totals.
+        """
+        conn = get_db()
+        if not conn:
+            raise ConnectionError("Error connecting to PostgreSQL")
+
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute(_RANGE_TOTALS_SQL.format(employee_columns='e.*'),
+                           (start, end, start, end))
+            return cursor.fetchall()
+        except Exception as e:
+            print("PayrollEngine._range_totals error:", e)
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def _indexed_range_totals(start, end, present):
+        """_range_totals with present days taken from ``present``
+        ({employee_id: days}); raises on database errors."""
+        conn = get_db()
+        if not conn:
+            raise ConnectionError("Error connecting to PostgreSQL")
+
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute(_RANGE_ADVANCES_SQL, (start, end))
+            rows = cursor.fetchall()
+        except Exception as e:
+            print("PayrollEngine._indexed_range_totals error:", e)
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+        for row in rows:
+            row['present_days'] = present.get(row['id'], 0)
+        return rows
+
+class EmployeeMonthSummary:
+    @staticmethod
+    def rebuild():
+        """Recompute the employee-month rollup from raw attendance and advances.
+
+        Returns the number of summary rows written, or None on error.
+        """
+        conn = get_db()
+        if not conn:
+            return None
+        cursor = conn.cursor()
+        try:
+            count = rebuild_month_summary(cursor)
+            bump_version(cursor, 'employee_month_summary')
+            conn.commit()
+            return count
+        except Exception as e:
+            print("EmployeeMonthSummary.rebuild error:", e)
+            conn.rollback()
+            return None
+        finally:
+            cursor.close()
+            conn.close()
+
+HISTORY_MONTHS = 6
+DETAIL_LIMIT = 500
+
+@dataclass
+class EmployeeReport:
+    """Totals and history the employee report page and PDF show for one period.
+
+    Day-by-day attendance and advance rows are not part of it: a long
+    period would make every cached report carry them. The page loads them
+    separately, capped, with load_details().
+    """
+    employee: dict
+    start_date: date
+    end_date: date
+    present_days: int
+    absent_days: int
+    total_advance: Decimal
+    current_sites: list
+    monthly_stats: list
+
+    @property
+    def gross_salary(self):
+        return self.present_days * self.employee['daily_salary']
+
+    @property
+    def net_salary(self):
+        return self.gross_salary - self.total_advance
+
+    @staticmethod
+    def history_start(today=None):
+        """First day of the oldest month in the monthly history"""
+        today = today or date.today()
+        months = today.year * 12 + today.month - HISTORY_MONTHS
+        return date(months // 12, months % 12 + 1, 1)
+
+    @staticmethod
+    def load(emp_id, start_date, end_date, history_start):
+        """Load an EmployeeReport in one round trip.
+
+        Period totals are counted in SQL, so the result is the same size for
+        any date range. The monthly history only reads attendance from
+        ``history_start`` on, through the (employee_id, date) unique index,
+        instead of grouping the employee's whole history. Returns None when
+        the employee does not exist.
+        """
+        conn = get_db()
+        if not conn:
+            return None
+        cursor = conn.cursor()
+        register_default_json(cursor, loads=lambda s: json.loads(s, parse_float=Decimal))
+        try:
+            cursor.execute('''
+                SELECT
+                    (SELECT row_to_json(e) FROM employees e WHERE e.id = %(id)s) AS employee,
+                    (SELECT COUNT(*) FROM attendance
+                     WHERE employee_id = %(id)s AND date BETWEEN %(start)s AND %(end)s
+                       AND status = 'Present') AS present_days,
+                    (SELECT COUNT(*) FROM attendance
+                     WHERE employee_id = %(id)s AND date BETWEEN %(start)s AND %(end)s
+                       AND status = 'Absent') AS absent_days,
+                    (SELECT COALESCE(SUM(amount), 0) FROM advances
+                     WHERE employee_id = %(id)s AND date BETWEEN %(start)s AND %(end)s
+                    ) AS total_advance,
+                    (SELECT COALESCE(json_agg(s ORDER BY s.assigned_date DESC), '[]')
+                     FROM (
+                        SELECT s.id, s.site_name, s.location, sw.assigned_date, sw.role_at_site
+                        FROM site_workers sw
+                        JOIN sites s ON sw.site_id = s.id
+                        WHERE sw.employee_id = %(id)s AND sw.is_active = TRUE
+                     ) s) AS current_sites,
+                    (SELECT COALESCE(json_agg(m ORDER BY m.month DESC), '[]')
+                     FROM (
+                        SELECT to_char(date, 'YYYY-MM') AS month,
+                            COUNT(*) FILTER (WHERE status = 'Present') AS present,
+                            COUNT(*) FILTER (WHERE status = 'Absent') AS absent
+                        FROM attendance
+                        WHERE employee_id = %(id)s AND date >= %(history_start)s
+                        GROUP BY 1
+                     ) m) AS monthly_stats
+            ''', {'id': emp_id, 'start': start_date, 'end': end_date,
+                  'history_start': history_start})
+            (employee, present_days, absent_days, total_advance,
+             current_sites, monthly_stats) = cursor.fetchone()
+            if employee is None:
+                return None
+            # JSON has no date type
+            for row in current_sites:
+                if row.get('assigned_date'):
+                    row['assigned_date'] = _as_date(row['assigned_date'])
+            return EmployeeReport(employee, _as_date(start_date), _as_date(end_date),
+                                  present_days, absent_days, total_advance,
+                                  current_sites, monthly_stats)
+        except Exception as e:
+            print("EmployeeReport.load error:", e)
+            return None
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def load_details(emp_id, start_date, end_date, limit=DETAIL_LIMIT):
+        """The newest ``limit`` attendance and advance rows in the period,
+        as (attendance, advances); two empty lists on error"""
+        conn = get_db()
+        if not conn:
+            return [], []
+        cursor = conn.cursor()
+        register_default_json(cursor, loads=lambda s: json.loads(s, parse_float=Decimal))
+        try:
+            cursor.execute('''
+                SELECT
+                    (SELECT COALESCE(json_agg(a ORDER BY a.date DESC), '[]')
+                     FROM (
+                        SELECT date, status FROM attendance
+                        WHERE employee_id = %(id)s AND date BETWEEN %(start)s AND %(end)s
+                        ORDER BY date DESC LIMIT %(limit)s
+                     ) a) AS attendance,
+                    (SELECT COALESCE(json_agg(v ORDER BY v.date DESC), '[]')
+                     FROM (
+                        SELECT date, amount, reason FROM advances
+                        WHERE employee_id = %(id)s AND date BETWEEN %(start)s AND %(end)s
+                        ORDER BY date DESC LIMIT %(limit)s
+                     ) v) AS advances
+            ''', {'id': emp_id, 'start': start_date, 'end': end_date, 'limit': limit})
+            attendance, advances = cursor.fetchone()
+            for row in attendance + advances:
+                row['date'] = _as_date(row['date'])
+            return attendance, advances
+        except Exception as e:
+            print("EmployeeReport.load_details error:", e)
+            return [], []
+        finally:
+            cursor.close()
+            conn.close()
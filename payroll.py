@@ -0,0 +1,223 @@
+"""
+Payroll results computed once and rendered to HTML, Excel, PDF or CSV
+"""
+
+from decimal import Decimal
+from tempfile import SpooledTemporaryFile
+import time
+
+from flask import Response, render_template
+
+from exports import RENDERERS, renderer
+import metrics
+from models import PayrollEngine, _as_date
+from report_cache import report_cache
+
+MONTH_NAMES = ['', 'January', 'February', 'March', 'April', 'May', 'June',
+               'July', 'August', 'September', 'October', 'November', 'December']
+PAYROLL_TABLES = ('employees', 'attendance', 'advances')
+MONTHLY_TABLES = PAYROLL_TABLES + ('employee_month_summary',)
+CENTS = Decimal('0.01')
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_SPOOL_SIZE = 1024 * 1024
+
+class InvalidPeriod(ValueError):
+    pass
+
+def _money(value):
+    return Decimal(value or 0).quantize(CENTS)
+
+def weekly_period(start_date, end_date):
+    """(start, end) dates from request values; raises InvalidPeriod"""
+    try:
+        return _as_date(start_date), _as_date(end_date)
+    except (TypeError, ValueError):
+        raise InvalidPeriod('start_date and end_date must be dates (YYYY-MM-DD)')
+
+def monthly_period(month, year):
+    """(month, year) ints from request values; raises InvalidPeriod"""
+    try:
+        month, year = int(month), int(year)
+    except (TypeError, ValueError):
+        month = year = 0
+    if not 1 <= month <= 12 or not 1 <= year <= 9999:
+        raise InvalidPeriod('month must be 1-12 and year a valid year')
+    return month, year
+
+class PayrollResult:
+    """Per-employee payroll figures for one period, plus totals.
+
+    All amounts are Decimals rounded to paise so every renderer shows the
+    same numbers.
+    """
+
+    def __init__(self, kind, period, rows):
+        self.kind = kind
+        self.period = period
+        self.total_gross = Decimal('0.00')
+        self.total_advance = Decimal('0.00')
+        self.total_net = Decimal('0.00')
+        self.rows = self._collect(self._compute(rows))
+
+    def _collect(self, rows):
+        return list(rows)
+
+    def _compute(self, rows):
+        for emp in rows:
+            daily_salary = _money(emp['daily_salary'])
+            present_days = int(emp['present_days'])
+            gross_salary = _money(present_days * daily_salary)
+            total_advance = _money(emp['total_advance'])
+            net_salary = gross_salary - total_advance
+
+            self.total_gross += gross_salary
+            self.total_advance += total_advance
+            self.total_net += net_salary
+
+            employee = dict(emp)
+            employee.pop('present_days', None)
+            employee.pop('total_advance', None)
+            yield {
+                'employee': employee,
+                'present_days': present_days,
+                'daily_salary': daily_salary,
+                'gross_salary': gross_salary,
+                'total_advance': total_advance,
+                'net_salary': net_salary
+            }
+
+    @property
+    def heading(self):
+        if self.kind == 'weekly':
+            return 'Weekly Payroll Report'
+        month, year = self.period
+        return f'Monthly Report - {MONTH_NAMES[month]} {year}'
+
+    @property
+    def period_label(self):
+        if self.kind == 'weekly':
+            start_date, end_date = self.period
+            return f'Period: {start_date} to {end_date}'
+        return None
+
+    @property
+    def filename(self):
+        if self.kind == 'weekly':
+            start_date, end_date = self.period
+            return f'weekly_payroll_{start_date}_to_{end_date}'
+        month, year = self.period
+        return f'monthly_report_{month:02d}_{year}'
+
+    @property
+    def columns(self):
+        """(header, row key, is money) for each exported column"""
+        columns = [('Employee ID', 'id', False), ('Name', 'name', False), ('Role', 'role', False)]
+        if self.kind == 'weekly':
+            columns += [('Present Days', 'present_days', False), ('Daily Salary', 'daily_salary', True),
+                        ('Gross Salary', 'gross_salary', True), ('Advance', 'total_advance', True),
+                        ('Net Salary', 'net_salary', True)]
+        else:
+            columns += [('Days Worked', 'present_days', False), ('Gross Salary', 'gross_salary', True),
+                        ('Advance', 'total_advance', True), ('Net Paid', 'net_salary', True)]
+        return columns
+
+    def values(self, row):
+        """Cell values for one row, in column order"""
+        values = []
+        for _, key, _ in self.columns:
+            if key in ('id', 'name', 'role'):
+                values.append(row['employee'][key])
+            else:
+                values.append(row[key])
+        return values
+
+    def totals(self):
+        """Totals row aligned to the columns"""
+        totals = {'gross_salary': self.total_gross, 'total_advance': self.total_advance,
+                  'net_salary': self.total_net}
+        values = [totals.get(key, '') for _, key, _ in self.columns]
+        values[0] = 'TOTAL'
+        return values
+
+    def render(self, fmt, **options):
+        return RENDERERS[fmt].render(self, **options)
+
+class PayrollStream(PayrollResult):
+    """PayrollResult whose rows are computed as they are read.
+
+    ``rows`` can be iterated once, and the totals are only complete after
+    that. Every export renderer writes the totals row last, so exports can
+    consume a server-side cursor end to end without holding all rows.
+    """
+
+    def _collect(self, rows):
+        return rows
+
+# ========================================
+# RENDERERS
+# ========================================
+
+@renderer('html', mimetype='text/html')
+def render_html(result, template, **context):
+    return render_template(template, result=result, **context)
+
+def _iter_file(fileobj):
+    try:
+        fileobj.seek(0)
+        while True:
+            chunk = fileobj.read(EXPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fileobj.close()
+
+def export_response(result, fmt):
+    """Render a result into a spooled temp file and stream it back in chunks.
+
+    Small files stay in memory; large ones spill to disk, so peak memory does
+    not grow with the size of the export.
+    """
+    spec = RENDERERS[fmt]
+    output = SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    started = time.perf_counter()
+    try:
+        result.render(fmt, output=output)
+    except Exception:
+        # Nothing has been sent yet, so the request fails instead of
+        # serving a truncated file
+        output.close()
+        raise
+    metrics.observe('payroll_export_render_seconds', time.perf_counter() - started, format=fmt)
+    size = output.tell()
+    response = Response(_iter_file(output), mimetype=spec.mimetype)
+    response.headers['Content-Length'] = str(size)
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename="{result.filename}.{spec.extension}"')
+    return response
+
+# ========================================
+# MEMOIZED LOADERS
+# ========================================
+
+def weekly_payroll(start_date, end_date):
+    """PayrollResult for an inclusive date range"""
+    period = weekly_period(start_date, end_date)
+    return report_cache.get_or_load('weekly_payroll', period, PAYROLL_TABLES, lambda: PayrollResult(
+        'weekly', period, PayrollEngine.get_period_totals(*period)))
+
+def weekly_payroll_stream(start_date, end_date):
+    """Uncached PayrollStream for an inclusive date range, for exports"""
+    period = weekly_period(start_date, end_date)
+    return PayrollStream('weekly', period, PayrollEngine.iter_period_totals(*period))
+
+def monthly_payroll(month, year):
+    """PayrollResult for a calendar month"""
+    period = monthly_period(month, year)
+    return report_cache.get_or_load('monthly_payroll', period, MONTHLY_TABLES, lambda: PayrollResult(
+        'monthly', period, PayrollEngine.get_month_totals(*period)))
+
+def monthly_payroll_stream(month, year):
+    """Uncached PayrollStream for a calendar month, for exports"""
+    period = monthly_period(month, year)
+    return PayrollStream('monthly', period, PayrollEngine.iter_month_totals(*period))
@@ -1,6 +1,11 @@
 -- ============================================
 -- Employee Payroll Management System Database
 -- Import this file in phpMyAdmin
+--
+-- Legacy MySQL schema, kept for reference only. The app runs on
+-- PostgreSQL and its schema (sites, materials, data_versions, the monthly
+-- summary) is created and upgraded by migrate.py: run `python migrate.py`
+-- instead of importing this file.
 -- ============================================
 
 -- Create Database
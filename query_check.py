@@ -0,0 +1,103 @@
+"""
+N+1 query detection and per-route query budgets
+
+Every statement a request runs is reduced to a fingerprint (literals and
+parameters replaced by ``?``, IN/VALUES lists collapsed) and counted. When
+one fingerprint repeats more than QUERY_REPEAT_LIMIT times, or a view
+decorated with ``@query_budget`` runs more statements than it declared, the
+request is reported.
+
+QUERY_CHECK selects what happens then: ``warn`` prints a warning,
+``strict`` raises QueryBudgetExceeded so the request fails (used by
+check_queries.py), ``off`` skips tracking. Unset, it is ``warn`` when the
+app runs in debug mode (FLASK_DEBUG=1) and ``off`` otherwise.
+"""
+
+from collections import Counter
+import os
+import re
+
+from flask import current_app, g, has_request_context, request
+
+from database import add_query_listener
+
+MODE = os.environ.get('QUERY_CHECK')
+REPEAT_LIMIT = int(os.environ.get('QUERY_REPEAT_LIMIT', 5))
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PARAM = re.compile(r'%\(\w+\)s|%s')
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ROWS = re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+')
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+def fingerprint(sql):
+    """Normalized SQL with literals and parameters replaced by ``?``"""
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    sql = ' '.join(str(sql).split()).lower()
+    sql = _STRING.sub('?', sql)
+    sql = _PARAM.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _LIST.sub('(?)', sql)
+    return _ROWS.sub('(?)', sql)
+
+def query_budget(max_queries, max_repeats=None):
+    """Declare the most statements a view may run per request, and
+    optionally its own limit on repeats of one fingerprint"""
+    def decorator(view):
+        view.query_budget = (max_queries, max_repeats)
+        return view
+    return decorator
+
+def problems(counts, budget=None):
+    """Descriptions of every way ``counts`` breaks the limits"""
+    max_queries, max_repeats = budget or (None, None)
+    limit = max_repeats if max_repeats is not None else REPEAT_LIMIT
+    found = []
+    total = sum(counts.values())
+    if max_queries is not None and total > max_queries:
+        found.append(f'{total} queries, budget is {max_queries}')
+    for sql, n in counts.most_common():
+        if n <= limit:
+            break
+        found.append(f'{n}x {sql[:160]}')
+    return found
+
+# ========================================
+# FLASK INTEGRATION
+# ========================================
+
+def _mode():
+    if MODE:
+        return MODE
+    return 'warn' if current_app.debug else 'off'
+
+def _on_query(sql, params, seconds):
+    if has_request_context() and 'query_fingerprints' in g:
+        g.query_fingerprints[fingerprint(sql)] += 1
+
+def _before_request():
+    if _mode() != 'off':
+        g.query_fingerprints = Counter()
+
+def _after_request(response):
+    counts = g.pop('query_fingerprints', None)
+    if counts is None:
+        return response
+    view = current_app.view_functions.get(request.endpoint)
+    found = problems(counts, getattr(view, 'query_budget', None))
+    if found:
+        message = f'{request.method} {request.path}: ' + '; '.join(found)
+        if _mode() == 'strict':
+            raise QueryBudgetExceeded(message)
+        print("⚠️  Query check:", message)
+    return response
+
+def init_query_check(app):
+    """Count each request's statements by fingerprint and check the limits"""
+    add_query_listener(_on_query)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
@@ -0,0 +1,25 @@
+"""
+Rebuild the employee_month_summary rollup from attendance and advances
+
+The rollup is kept current by database triggers; run this to backfill it
+or to repair it after data was changed with the triggers disabled.
+
+Usage:
+    python rebuild_month_summary.py
+"""
+
+import sys
+
+from models import EmployeeMonthSummary
+
+def main():
+    print("🔄 Rebuilding employee month summary...")
+    count = EmployeeMonthSummary.rebuild()
+    if count is None:
+        print("❌ Rebuild failed!")
+        return 1
+    print(f"✅ Rebuilt {count} employee-month row(s)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,40 @@
+"""
+Recompute material bill balances from payment history and report drift
+
+Usage:
+    python reconcile_balances.py            # report only
+    python reconcile_balances.py --apply    # report and fix
+"""
+
+import argparse
+import sys
+
+from models import MaterialPayment
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--apply', action='store_true',
+                        help='correct drifted bills instead of only reporting them')
+    args = parser.parse_args()
+
+    print("🔄 Reconciling material balances...")
+    drifted = MaterialPayment.reconcile(apply=args.apply)
+    if drifted is None:
+        print("❌ Reconciliation failed!")
+        return 1
+
+    for row in drifted:
+        print(f"  bill {row['id']}: paid {row['stored_paid']} -> {row['expected_paid']}, "
+              f"balance {row['stored_balance']} -> {row['expected_balance']}, "
+              f"status {row['stored_status']} -> {row['expected_status']}")
+
+    if not drifted:
+        print("✅ No drift found")
+    elif args.apply:
+        print(f"✅ Fixed {len(drifted)} bill(s)")
+    else:
+        print(f"⚠️ {len(drifted)} bill(s) drifted; rerun with --apply to fix")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
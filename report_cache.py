@@ -0,0 +1,62 @@
+"""
+In-process LRU cache for computed reports
+
+Entries are keyed by report type, parameters and the current data version of
+every table the report reads. Model write methods bump those versions in the
+same transaction as the write, so a changed table always produces a new key
+and stale entries are never served; they just age out of the LRU.
+"""
+
+from collections import OrderedDict
+import os
+import threading
+
+from models import DataVersion
+
+class ReportCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, report, params, tables, load):
+        """Return the cached report, calling load() on a miss.
+
+        A None result means the load failed and is returned uncached.
+        """
+        versions = DataVersion.get(*tables)
+        if versions is None:
+            # No version means no way to prove freshness, so don't cache
+            return load()
+
+        key = (report, tuple(params), tuple(tables), versions)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = load()
+        if value is None:
+            # Loaders return None on errors; don't pin a failure to these versions
+            return value
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries,
+                    'hits': self.hits, 'misses': self.misses}
+
+report_cache = ReportCache(int(os.environ.get('REPORT_CACHE_SIZE', 128)))
@@ -1,18 +1,42 @@
-from flask import render_template, request, redirect, url_for, flash, send_file
+from flask import render_template, request, redirect, url_for, flash, send_file, jsonify, Response
 from models import (Employee, Attendance, Advance, Site, SiteWorker, 
-                   MaterialCategory, SiteMaterial, MaterialPayment, SiteExpense)
+                   MaterialCategory, SiteMaterial, MaterialPayment, SiteExpense,
+                   SiteAggregate, EmployeeReport, DETAIL_LIMIT, month_range)
 from datetime import datetime, timedelta
 from io import BytesIO
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER
-from database import get_db
-from psycopg2.extras import RealDictCursor
+from database import pool_stats
+import payroll
+import exports
+import export_jobs
+import metrics
+from query_check import query_budget
+import attendance_import
+import site_import
+from report_cache import report_cache
+from slow_queries import slow_query_log
+
+SITE_TABLES = ('sites', 'site_workers', 'employees', 'site_materials',
+               'material_categories', 'material_payments', 'site_expenses')
+EMPLOYEE_REPORT_TABLES = ('employees', 'attendance', 'advances', 'site_workers', 'sites')
+
+def load_employee_report(emp_id):
+    """Cached EmployeeReport for the requested period (default: this month)"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    if not start_date or not end_date:
+        today = datetime.now()
+        first, next_first = month_range(today.month, today.year)
+        start_date = first.strftime('%Y-%m-%d')
+        end_date = (next_first - timedelta(days=1)).strftime('%Y-%m-%d')
+    
+    history_start = EmployeeReport.history_start()
+    return report_cache.get_or_load(
+        'employee_report', (emp_id, start_date, end_date, history_start), EMPLOYEE_REPORT_TABLES,
+        lambda: EmployeeReport.load(emp_id, start_date, end_date, history_start))
+
+def wants_html():
+    """True for browser form posts and page loads, False for API clients"""
+    return request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'text/html'
 
 def init_routes(app):
     
@@ -21,18 +45,37 @@ def init_routes(app):
     # ========================================
     
     @app.route('/')
+    @query_budget(2)
     def dashboard():
         total_employees = Employee.count()
         return render_template('dashboard.html', total_employees=total_employees)
     
+    @app.route('/db_pool_status')
+    def db_pool_status():
+        """Connection pool occupancy and wait times, for sizing workers"""
+        return jsonify(pool_stats())
+    
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Prometheus metrics, summed across all worker processes"""
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+    
+    @app.route('/admin/slow_queries')
+    def slow_queries():
+        """Recent slow statements in this worker, with sampled EXPLAIN plans"""
+        return render_template('slow_queries.html', entries=slow_query_log.recent(),
+                               threshold_ms=slow_query_log.threshold * 1000)
+    
     # ========================================
     # EMPLOYEE ROUTES
     # ========================================
     
     @app.route('/employees')
+    @query_budget(2)
     def employees():
-        employees = Employee.get_all()
-        return render_template('employees.html', employees=employees)
+        page = Employee.get_page(after=request.args.get('after', type=int),
+                                 before=request.args.get('before', type=int))
+        return render_template('employees.html', employees=page['rows'], page=page)
     
     @app.route('/add_employee', methods=['GET', 'POST'])
     def add_employee():
@@ -68,15 +111,24 @@ def init_routes(app):
     # ========================================
     
     @app.route('/attendance', methods=['GET', 'POST'])
+    @query_budget(6)
     def attendance():
         if request.method == 'POST':
             date = request.form['date']
             employees = Employee.get_all()
+            attendance_dict = {rec['employee_id']: rec['status'] for rec in Attendance.get_by_date(date)}
+            
+            # Only write rows whose status actually changed
+            changes = {}
             for emp in employees:
                 status = request.form.get(f'status_{emp["id"]}')
-                if status:
-                    Attendance.mark(emp['id'], date, status)
-            flash('Attendance marked successfully!', 'success')
+                if status and attendance_dict.get(emp['id']) != status:
+                    changes[emp['id']] = status
+            
+            if Attendance.mark_many(date, changes):
+                flash('Attendance marked successfully!', 'success')
+            else:
+                flash('Error saving attendance!', 'error')
             return redirect(url_for('attendance'))
         
         date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
@@ -90,11 +142,38 @@ def init_routes(app):
                              date=date,
                              attendance_dict=attendance_dict)
     
+    @app.route('/import_attendance', methods=['GET', 'POST'])
+    @query_budget(6)
+    def import_attendance():
+        if request.method == 'POST':
+            upload = request.files.get('file')
+            if not upload or not upload.filename.lower().endswith(('.csv', '.xlsx')):
+                flash('Please choose a .csv or .xlsx file!', 'error')
+                return redirect(url_for('import_attendance'))
+            
+            try:
+                stats = attendance_import.import_attendance(upload.stream, upload.filename)
+            except ValueError as e:
+                flash(f'Could not read file: {e}', 'error')
+                return redirect(url_for('import_attendance'))
+            
+            if stats is None:
+                flash('Error importing attendance!', 'error')
+            else:
+                flash(f"Imported {stats['merged']} of {stats['read']} rows "
+                      f"({stats['rejected']} rejected).", 'success')
+                if stats['unknown_employee_ids']:
+                    flash(f"Unknown employee IDs skipped: {stats['unknown_employee_ids']}", 'error')
+            return redirect(url_for('import_attendance'))
+        
+        return render_template('import_attendance.html')
+    
     # ========================================
     # ADVANCE ROUTES
     # ========================================
     
     @app.route('/advance', methods=['GET', 'POST'])
+    @query_budget(3)
     def advance():
         if request.method == 'POST':
             employee_id = int(request.form['employee_id'])
@@ -106,14 +185,19 @@ def init_routes(app):
             return redirect(url_for('advance'))
         
         employees = Employee.get_all()
-        advances = Advance.get_all()
-        return render_template('advance.html', employees=employees, advances=advances)
+        try:
+            page = Advance.get_page(after=request.args.get('after'),
+                                    before=request.args.get('before'))
+        except ValueError:
+            return redirect(url_for('advance'))
+        return render_template('advance.html', employees=employees, advances=page['rows'], page=page)
     
     # ========================================
     # WEEKLY PAYROLL ROUTES
     # ========================================
     
     @app.route('/weekly_payroll', methods=['GET', 'POST'])
+    @query_budget(4)
     def weekly_payroll():
         if request.method == 'POST':
             start_date = request.form['start_date']
@@ -125,164 +209,39 @@ def init_routes(app):
             end_date = request.args.get('end_date', 
                                        (today + timedelta(days=6-today.weekday())).strftime('%Y-%m-%d'))
         
-        employees = Employee.get_all()
-        payroll_data = []
-        total_payroll = 0
-        
-        for emp in employees:
-            present_days = Attendance.get_week_attendance(emp['id'], start_date, end_date)
-            gross_salary = present_days * emp['daily_salary']
-            total_advance = Advance.get_week_advance(emp['id'], start_date, end_date)
-            net_salary = float(gross_salary) - float(total_advance)
-            total_payroll += net_salary
-            
-            payroll_data.append({
-                'employee': emp,
-                'present_days': present_days,
-                'gross_salary': float(gross_salary),
-                'total_advance': float(total_advance),
-                'net_salary': net_salary
-            })
-        
-        return render_template('weekly_payroll.html', 
-                             payroll_data=payroll_data,
-                             start_date=start_date,
-                             end_date=end_date,
-                             total_payroll=total_payroll)
-    
+        result = payroll.weekly_payroll(start_date, end_date)
+        return result.render('html', template='weekly_payroll.html',
+                             start_date=start_date, end_date=end_date)
+    
+    @app.errorhandler(payroll.InvalidPeriod)
+    def invalid_period(e):
+        """Missing or malformed report dates are a bad request, not a 500"""
+        if wants_html():
+            flash(str(e), 'error')
+            return redirect(url_for('dashboard'))
+        return jsonify({'error': str(e)}), 400
+
     @app.route('/export_weekly_excel')
     def export_weekly_excel():
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Weekly Payroll"
-        
-        ws.merge_cells('A1:H1')
-        ws['A1'] = 'SAVUNADRY CONSTRUCTION'
-        ws['A1'].font = Font(size=16, bold=True)
-        ws['A1'].alignment = Alignment(horizontal='center')
-        
-        ws.merge_cells('A2:H2')
-        ws['A2'] = f'Weekly Payroll Report'
-        ws['A2'].font = Font(size=12, bold=True)
-        ws['A2'].alignment = Alignment(horizontal='center')
-        
-        ws.merge_cells('A3:H3')
-        ws['A3'] = f'Period: {start_date} to {end_date}'
-        ws['A3'].font = Font(size=10)
-        ws['A3'].alignment = Alignment(horizontal='center')
-        
-        headers = ['Employee ID', 'Name', 'Role', 'Present Days', 'Daily Salary', 'Gross Salary', 'Advance', 'Net Salary']
-        ws.append([])
-        ws.append(headers)
-        
-        header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-        header_font = Font(color='FFFFFF', bold=True)
-        for cell in ws[5]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')
-        
-        employees = Employee.get_all()
-        total_payroll = 0
-        
-        for emp in employees:
-            present_days = Attendance.get_week_attendance(emp['id'], start_date, end_date)
-            gross_salary = present_days * float(emp['daily_salary'])
-            total_advance = float(Advance.get_week_advance(emp['id'], start_date, end_date))
-            net_salary = gross_salary - total_advance
-            total_payroll += net_salary
-            
-            ws.append([
-                emp['id'], emp['name'], emp['role'], present_days,
-                float(emp['daily_salary']), gross_salary, total_advance, net_salary
-            ])
-        
-        ws.append([])
-        total_row = ws.max_row
-        ws[f'A{total_row}'] = 'TOTAL'
-        ws[f'A{total_row}'].font = Font(bold=True)
-        ws[f'H{total_row}'] = total_payroll
-        ws[f'H{total_row}'].font = Font(bold=True)
-        
-        for row in ws.iter_rows(min_row=6, max_row=ws.max_row, min_col=5, max_col=8):
-            for cell in row:
-                cell.number_format = '₹#,##0.00'
-        
-        for col in ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']:
-            ws.column_dimensions[col].width = 15
-        
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        return send_file(output,
-                        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                        as_attachment=True,
-                        download_name=f'weekly_payroll_{start_date}_to_{end_date}.xlsx')
+        result = payroll.weekly_payroll_stream(request.args.get('start_date'), request.args.get('end_date'))
+        return payroll.export_response(result, 'xlsx')
     
     @app.route('/export_weekly_pdf')
     def export_weekly_pdf():
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        
-        output = BytesIO()
-        doc = SimpleDocTemplate(output, pagesize=landscape(A4))
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'],
-                                     fontSize=18, spaceAfter=10, alignment=TA_CENTER)
-        
-        elements.append(Paragraph('SAVUNADRY CONSTRUCTION', title_style))
-        elements.append(Paragraph(f'Weekly Payroll Report', styles['Heading2']))
-        elements.append(Paragraph(f'Period: {start_date} to {end_date}', styles['Normal']))
-        elements.append(Spacer(1, 20))
-        
-        employees = Employee.get_all()
-        data = [['ID', 'Name', 'Role', 'Days', 'Daily Salary', 'Gross', 'Advance', 'Net Salary']]
-        total_payroll = 0
-        
-        for emp in employees:
-            present_days = Attendance.get_week_attendance(emp['id'], start_date, end_date)
-            gross_salary = present_days * float(emp['daily_salary'])
-            total_advance = float(Advance.get_week_advance(emp['id'], start_date, end_date))
-            net_salary = gross_salary - total_advance
-            total_payroll += net_salary
-            
-            data.append([str(emp['id']), emp['name'], emp['role'], str(present_days),
-                        f"₹{emp['daily_salary']:.2f}", f"₹{gross_salary:.2f}",
-                        f"₹{total_advance:.2f}", f"₹{net_salary:.2f}"])
-        
-        data.append(['', '', '', '', '', '', 'TOTAL:', f"₹{total_payroll:.2f}"])
-        
-        table = Table(data, colWidths=[0.6*inch, 1.5*inch, 1.2*inch, 0.8*inch, 1*inch, 1*inch, 1*inch, 1.2*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4472C4')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#E7E6E6')),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        elements.append(table)
-        doc.build(elements)
-        output.seek(0)
-        
-        return send_file(output, mimetype='application/pdf', as_attachment=True,
-                        download_name=f'weekly_payroll_{start_date}_to_{end_date}.pdf')
+        result = payroll.weekly_payroll_stream(request.args.get('start_date'), request.args.get('end_date'))
+        return payroll.export_response(result, 'pdf')
+    
+    @app.route('/export_weekly_csv')
+    def export_weekly_csv():
+        result = payroll.weekly_payroll_stream(request.args.get('start_date'), request.args.get('end_date'))
+        return payroll.export_response(result, 'csv')
     
     # ========================================
     # MONTHLY REPORT ROUTES
     # ========================================
     
     @app.route('/monthly_report', methods=['GET', 'POST'])
+    @query_budget(4)
     def monthly_report():
         if request.method == 'POST':
             month = request.form['month']
@@ -292,165 +251,82 @@ def init_routes(app):
             month = request.args.get('month', f'{today.month:02d}')
             year = request.args.get('year', str(today.year))
         
-        employees = Employee.get_all()
-        report_data = []
-        total_salary = 0
-        total_advance = 0
-        total_net = 0
-        
-        for emp in employees:
-            present_days = Attendance.get_month_attendance(emp['id'], month, year)
-            gross_salary = present_days * emp['daily_salary']
-            advance_amount = Advance.get_month_advance(emp['id'], month, year)
-            net_amount = float(gross_salary) - float(advance_amount)
-            
-            total_salary += float(gross_salary)
-            total_advance += float(advance_amount)
-            total_net += net_amount
-            
-            report_data.append({
-                'employee': emp,
-                'present_days': present_days,
-                'gross_salary': float(gross_salary),
-                'total_advance': float(advance_amount),
-                'net_amount': net_amount
-            })
-        
-        return render_template('monthly_report.html', 
-                             report_data=report_data, month=month, year=year,
-                             total_salary=total_salary, total_advance=total_advance,
-                             total_net=total_net)
+        result = payroll.monthly_payroll(month, year)
+        return result.render('html', template='monthly_report.html', month=month, year=year)
     
     @app.route('/export_monthly_excel')
     def export_monthly_excel():
-        month = request.args.get('month')
-        year = request.args.get('year')
-        
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Monthly Report"
-        
-        ws.merge_cells('A1:G1')
-        ws['A1'] = 'SAVUNADRY CONSTRUCTION'
-        ws['A1'].font = Font(size=16, bold=True)
-        ws['A1'].alignment = Alignment(horizontal='center')
-        
-        month_names = ['', 'January', 'February', 'March', 'April', 'May', 'June',
-                      'July', 'August', 'September', 'October', 'November', 'December']
-        ws.merge_cells('A2:G2')
-        ws['A2'] = f'Monthly Report - {month_names[int(month)]} {year}'
-        ws['A2'].font = Font(size=12, bold=True)
-        ws['A2'].alignment = Alignment(horizontal='center')
-        
-        headers = ['Employee ID', 'Name', 'Role', 'Days Worked', 'Gross Salary', 'Advance', 'Net Paid']
-        ws.append([])
-        ws.append(headers)
-        
-        header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-        header_font = Font(color='FFFFFF', bold=True)
-        for cell in ws[4]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')
-        
-        employees = Employee.get_all()
-        total_salary = 0
-        total_advance = 0
-        total_net = 0
-        
-        for emp in employees:
-            present_days = Attendance.get_month_attendance(emp['id'], month, year)
-            gross_salary = present_days * float(emp['daily_salary'])
-            advance_amount = float(Advance.get_month_advance(emp['id'], month, year))
-            net_amount = gross_salary - advance_amount
-            
-            total_salary += gross_salary
-            total_advance += advance_amount
-            total_net += net_amount
-            
-            ws.append([emp['id'], emp['name'], emp['role'], present_days,
-                      gross_salary, advance_amount, net_amount])
-        
-        ws.append([])
-        total_row = ws.max_row
-        ws[f'A{total_row}'] = 'TOTAL'
-        ws[f'E{total_row}'] = total_salary
-        ws[f'F{total_row}'] = total_advance
-        ws[f'G{total_row}'] = total_net
-        for col in ['A', 'E', 'F', 'G']:
-            ws[f'{col}{total_row}'].font = Font(bold=True)
-        
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        return send_file(output,
-                        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                        as_attachment=True,
-                        download_name=f'monthly_report_{month}_{year}.xlsx')
+        result = payroll.monthly_payroll_stream(request.args.get('month'), request.args.get('year'))
+        return payroll.export_response(result, 'xlsx')
     
     @app.route('/export_monthly_pdf')
     def export_monthly_pdf():
-        month = request.args.get('month')
-        year = request.args.get('year')
-        
-        month_names = ['', 'January', 'February', 'March', 'April', 'May', 'June',
-                      'July', 'August', 'September', 'October', 'November', 'December']
-        
-        output = BytesIO()
-        doc = SimpleDocTemplate(output, pagesize=landscape(A4))
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'],
-                                     fontSize=18, spaceAfter=10, alignment=TA_CENTER)
-        
-        elements.append(Paragraph('SAVUNADRY CONSTRUCTION', title_style))
-        elements.append(Paragraph(f'Monthly Report - {month_names[int(month)]} {year}', styles['Heading2']))
-        elements.append(Spacer(1, 20))
-        
-        employees = Employee.get_all()
-        data = [['ID', 'Name', 'Role', 'Days', 'Gross', 'Advance', 'Net']]
-        total_salary = 0
-        total_advance = 0
-        total_net = 0
-        
-        for emp in employees:
-            present_days = Attendance.get_month_attendance(emp['id'], month, year)
-            gross_salary = present_days * float(emp['daily_salary'])
-            advance_amount = float(Advance.get_month_advance(emp['id'], month, year))
-            net_amount = gross_salary - advance_amount
-            
-            total_salary += gross_salary
-            total_advance += advance_amount
-            total_net += net_amount
-            
-            data.append([str(emp['id']), emp['name'], emp['role'], str(present_days),
-                        f"₹{gross_salary:.2f}", f"₹{advance_amount:.2f}", f"₹{net_amount:.2f}"])
-        
-        data.append(['', '', '', 'TOTAL:', f"₹{total_salary:.2f}", f"₹{total_advance:.2f}", f"₹{total_net:.2f}"])
-        
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4472C4')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        elements.append(table)
-        doc.build(elements)
-        output.seek(0)
-        
-        return send_file(output, mimetype='application/pdf', as_attachment=True,
-                        download_name=f'monthly_report_{month}_{year}.pdf')
+        result = payroll.monthly_payroll_stream(request.args.get('month'), request.args.get('year'))
+        return payroll.export_response(result, 'pdf')
+    
+    @app.route('/export_monthly_csv')
+    def export_monthly_csv():
+        result = payroll.monthly_payroll_stream(request.args.get('month'), request.args.get('year'))
+        return payroll.export_response(result, 'csv')
+    
+    # ========================================
+    # BACKGROUND EXPORT ROUTES
+    # ========================================
+    
+    @app.route('/export_jobs', methods=['POST'])
+    @query_budget(3)
+    def submit_export_job():
+        """Queue a payroll export and return its job id"""
+        report = request.values.get('report')
+        fmt = request.values.get('format', 'xlsx')
+        if fmt not in ('xlsx', 'pdf', 'csv'):
+            return jsonify({'error': 'Unsupported format'}), 400
+        
+        if report == 'weekly':
+            result = payroll.weekly_payroll(request.values['start_date'], request.values['end_date'])
+        elif report == 'monthly':
+            result = payroll.monthly_payroll(request.values['month'], request.values['year'])
+        else:
+            return jsonify({'error': 'Unknown report'}), 400
+        
+        job_id = export_jobs.submit(result, fmt)
+        if wants_html():
+            return redirect(url_for('export_job_status', job_id=job_id))
+        return jsonify({'job_id': job_id,
+                        'status_url': url_for('export_job_status', job_id=job_id)}), 202
+    
+    @app.route('/export_jobs/<job_id>')
+    def export_job_status(job_id):
+        job = export_jobs.get_job(job_id)
+        if not job:
+            if wants_html():
+                flash('Export not found!', 'error')
+                return redirect(url_for('dashboard'))
+            return jsonify({'error': 'Job not found'}), 404
+        
+        status = {'job_id': job_id, 'status': job['status']}
+        if job['status'] == 'done':
+            status['download_url'] = url_for('download_export_job', job_id=job_id)
+        elif job['status'] == 'failed':
+            status['error'] = job.get('error')
+        if wants_html():
+            return render_template('export_job.html', job=status, filename=job.get('filename'))
+        return jsonify(status)
+    
+    @app.route('/export_jobs/<job_id>/download')
+    def download_export_job(job_id):
+        job = export_jobs.get_job(job_id)
+        if not job or job['status'] != 'done':
+            return jsonify({'error': 'Export not ready'}), 404
+        return send_file(job['path'], mimetype=job['mimetype'], as_attachment=True,
+                        download_name=job['filename'])
     
     # ========================================
     # SITE MANAGEMENT ROUTES
     # ========================================
     
     @app.route('/sites')
+    @query_budget(2)
     def sites():
         sites = Site.get_all()
         return render_template('sites.html', sites=sites)
@@ -507,25 +383,17 @@ def init_routes(app):
         return redirect(url_for('sites'))
     
     @app.route('/site_detail/<int:site_id>')
+    @query_budget(4)
     def site_detail(site_id):
-        site = Site.get_summary(site_id)
-        workers = SiteWorker.get_site_workers(site_id)
-        materials = SiteMaterial.get_site_materials(site_id)
-        expenses = SiteExpense.get_site_expenses(site_id)
+        bundle = report_cache.get_or_load('site_bundle', (site_id,), SITE_TABLES,
+                                          lambda: SiteAggregate.load(site_id))
+        if not bundle:
+            flash('Site not found!', 'error')
+            return redirect(url_for('sites'))
         
-        material_summary = {}
-        for material in materials:
-            category = material['category_name']
-            if category not in material_summary:
-                material_summary[category] = {'total_cost': 0, 'total_paid': 0, 'total_balance': 0, 'count': 0}
-            material_summary[category]['total_cost'] += float(material['total_cost'])
-            material_summary[category]['total_paid'] += float(material['amount_paid'])
-            material_summary[category]['total_balance'] += float(material['amount_balance'])
-            material_summary[category]['count'] += 1
-        
-        return render_template('site_detail.html', site=site, workers=workers,
-                             materials=materials, expenses=expenses,
-                             material_summary=material_summary)
+        return render_template('site_detail.html', site=bundle.site, workers=bundle.workers,
+                             materials=bundle.materials, expenses=bundle.expenses,
+                             material_summary=bundle.material_summary)
     
     @app.route('/assign_worker/<int:site_id>', methods=['GET', 'POST'])
     def assign_worker(site_id):
@@ -607,9 +475,18 @@ def init_routes(app):
         return render_template('add_payment.html', material=material)
     
     @app.route('/pending_payments')
+    @query_budget(2)
     def pending_payments():
-        materials = SiteMaterial.get_pending_payments()
-        return render_template('pending_payments.html', materials=materials)
+        if request.args.get('view') == 'summary':
+            summary = SiteMaterial.get_outstanding_summary()
+            return render_template('pending_payments.html', summary=summary)
+        
+        try:
+            page = SiteMaterial.get_pending_payments(after=request.args.get('after'),
+                                                     before=request.args.get('before'))
+        except ValueError:
+            return redirect(url_for('pending_payments'))
+        return render_template('pending_payments.html', materials=page['rows'], page=page)
     
     @app.route('/add_expense/<int:site_id>', methods=['GET', 'POST'])
     def add_expense(site_id):
@@ -630,205 +507,131 @@ def init_routes(app):
         site = Site.get_by_id(site_id)
         return render_template('add_expense.html', site=site)
     
+    @app.route('/import_site_data/<int:site_id>', methods=['GET', 'POST'])
+    def import_site_data(site_id):
+        if request.method == 'POST':
+            kind = request.form.get('kind')
+            upload = request.files.get('file')
+            if kind not in site_import.IMPORTERS:
+                flash('Choose materials or expenses!', 'error')
+            elif not upload or not upload.filename.lower().endswith(('.csv', '.xlsx')):
+                flash('Please choose a .csv or .xlsx file!', 'error')
+            else:
+                try:
+                    inserted, errors = site_import.IMPORTERS[kind](upload.stream, upload.filename, site_id)
+                except ValueError as e:
+                    inserted, errors = 0, [str(e)]
+                
+                if errors:
+                    for error in errors[:20]:
+                        flash(error, 'error')
+                    flash(f'{len(errors)} invalid row(s); nothing was imported.', 'error')
+                elif inserted is None:
+                    flash('Error importing file!', 'error')
+                else:
+                    flash(f'Imported {inserted} {kind} row(s)!', 'success')
+                    return redirect(url_for('site_detail', site_id=site_id))
+            return redirect(url_for('import_site_data', site_id=site_id))
+        
+        site = Site.get_by_id(site_id)
+        return render_template('import_site_data.html', site=site)
+    
     @app.route('/site_report/<int:site_id>')
     def site_report(site_id):
-        site = Site.get_summary(site_id)
-        workers = SiteWorker.get_site_workers(site_id)
-        materials = SiteMaterial.get_site_materials(site_id)
-        expenses = SiteExpense.get_site_expenses(site_id)
-        
-        # Calculate totals
-        total_material_cost = sum(float(m['total_cost']) for m in materials)
-        total_material_paid = sum(float(m['amount_paid']) for m in materials)
-        total_material_balance = sum(float(m['amount_balance']) for m in materials)
-        total_expenses = sum(float(e['amount']) for e in expenses)
+        bundle = report_cache.get_or_load('site_bundle', (site_id,), SITE_TABLES,
+                                          lambda: SiteAggregate.load(site_id))
+        if not bundle:
+            flash('Site not found!', 'error')
+            return redirect(url_for('sites'))
         
         return render_template('site_report.html',
-                             site=site,
-                             workers=workers,
-                             materials=materials,
-                             expenses=expenses,
-                             total_material_cost=total_material_cost,
-                             total_material_paid=total_material_paid,
-                             total_material_balance=total_material_balance,
-                             total_expenses=total_expenses)
+                             site=bundle.site,
+                             workers=bundle.workers,
+                             materials=bundle.materials,
+                             expenses=bundle.expenses,
+                             total_material_cost=bundle.total_material_cost,
+                             total_material_paid=bundle.total_material_paid,
+                             total_material_balance=bundle.total_material_balance,
+                             total_expenses=bundle.total_expenses)
     
 
     @app.route('/employee_report/<int:emp_id>')
+    @query_budget(3)
     def employee_report(emp_id):
-
-        employee = Employee.get_by_id(emp_id)
-        if not employee:
+        report = load_employee_report(emp_id)
+        if not report:
             flash('Employee not found!', 'error')
             return redirect(url_for('employees'))
 
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-
-        if not start_date or not end_date:
-            today = datetime.now()
-            start_date = today.replace(day=1).strftime('%Y-%m-%d')
-            end_date = (today.replace(month=today.month % 12 + 1, day=1) - timedelta(days=1)).strftime('%Y-%m-%d')
-
-        conn = get_db()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-        cursor.execute("""
-            SELECT date, status FROM attendance
-            WHERE employee_id=%s AND date BETWEEN %s AND %s
-            ORDER BY date DESC
-        """, (emp_id, start_date, end_date))
-        attendance_records = cursor.fetchall()
-
-        present_days = sum(1 for r in attendance_records if r["status"] == "Present")
-        absent_days = sum(1 for r in attendance_records if r["status"] == "Absent")
-        gross_salary = present_days * float(employee["daily_salary"])
-
-        cursor.execute("""
-            SELECT date, amount, reason FROM advances
-            WHERE employee_id=%s AND date BETWEEN %s AND %s
-            ORDER BY date DESC
-        """, (emp_id, start_date, end_date))
-        advances = cursor.fetchall()
-
-        total_advance = sum(float(a["amount"]) for a in advances)
-        net_salary = gross_salary - total_advance
-
-        cursor.execute("""
-            SELECT s.id, s.site_name, s.location, sw.assigned_date, sw.role_at_site
-            FROM site_workers sw
-            JOIN sites s ON sw.site_id = s.id
-            WHERE sw.employee_id=%s AND sw.is_active=true
-        """, (emp_id,))
-        current_sites = cursor.fetchall()
-
-        cursor.execute("""
-            SELECT 
-                to_char(date, 'YYYY-MM') AS month,
-                SUM(CASE WHEN status='Present' THEN 1 ELSE 0 END) AS present,
-                SUM(CASE WHEN status='Absent' THEN 1 ELSE 0 END) AS absent
-            FROM attendance
-            WHERE employee_id=%s
-            GROUP BY month
-            ORDER BY month DESC
-            LIMIT 6
-        """, (emp_id,))
-        monthly_stats = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
+        attendance_records, advances = EmployeeReport.load_details(
+            emp_id, report.start_date, report.end_date)
         return render_template("employee_report.html",
-            employee=employee,
-            start_date=start_date,
-            end_date=end_date,
+            employee=report.employee,
+            start_date=report.start_date,
+            end_date=report.end_date,
             attendance_records=attendance_records,
-            present_days=present_days,
-            absent_days=absent_days,
-            gross_salary=gross_salary,
+            present_days=report.present_days,
+            absent_days=report.absent_days,
+            gross_salary=report.gross_salary,
             advances=advances,
-            total_advance=total_advance,
-            net_salary=net_salary,
-            current_sites=current_sites,
-            monthly_stats=monthly_stats)
+            detail_limit=DETAIL_LIMIT,
+            total_advance=report.total_advance,
+            net_salary=report.net_salary,
+            current_sites=report.current_sites,
+            monthly_stats=report.monthly_stats)
+
 
+    @app.route('/employee_attendance_heatmap/<int:emp_id>')
+    def employee_attendance_heatmap(emp_id):
+        """Present days of one year as JSON for a calendar heatmap"""
+        year = request.args.get('year', datetime.now().year, type=int)
+        heatmap = Attendance.get_year_heatmap(emp_id, year)
+        if heatmap is None:
+            return jsonify({'error': 'Database unavailable'}), 503
+        return jsonify(heatmap)
 
     @app.route('/employee_report_pdf/<int:emp_id>')
+    @query_budget(3)
     def employee_report_pdf(emp_id):
         """Export employee report to PDF"""
         
-        employee = Employee.get_by_id(emp_id)
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        
-        # Get all data (same as above)
-        conn = get_db()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute('''
-            SELECT date, status
-            FROM attendance
-            WHERE employee_id = %s AND date BETWEEN %s AND %s
-            ORDER BY date
-        ''', (emp_id, start_date, end_date))
-        attendance_records = cursor.fetchall()
-        
-        present_days = sum(1 for rec in attendance_records if rec['status'] == 'Present')
-        gross_salary = present_days * float(employee['daily_salary'])
-        
-        cursor.execute('''
-            SELECT date, amount, reason
-            FROM advances
-            WHERE employee_id = %s AND date BETWEEN %s AND %s
-            ORDER BY date
-        ''', (emp_id, start_date, end_date))
-        advances = cursor.fetchall()
-        
-        total_advance = sum(float(adv['amount']) for adv in advances)
-        net_salary = gross_salary - total_advance
-        
-        cursor.close()
-        conn.close()
+        report = load_employee_report(emp_id)
+        if not report:
+            flash('Employee not found!', 'error')
+            return redirect(url_for('employees'))
         
-        # Create PDF
         output = BytesIO()
-        doc = SimpleDocTemplate(output, pagesize=A4)
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        # Title
-        title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'],
-                                    fontSize=18, spaceAfter=10, alignment=TA_CENTER)
-        
-        elements.append(Paragraph('SAVUNADRY CONSTRUCTION', title_style))
-        elements.append(Paragraph('Employee Salary Report', styles['Heading2']))
-        elements.append(Spacer(1, 20))
-        
-        # Employee Details
-        emp_data = [
-            ['Employee Name:', employee['name']],
-            ['Employee ID:', str(employee['id'])],
-            ['Role:', employee['role']],
-            ['Daily Salary:', f"₹{employee['daily_salary']:.2f}"],
-            ['Period:', f"{start_date} to {end_date}"]
-        ]
-        
-        emp_table = Table(emp_data, colWidths=[2*inch, 4*inch])
-        emp_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0f0f0')),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(emp_table)
-        elements.append(Spacer(1, 20))
-        
-        # Salary Summary
-        summary_data = [
-            ['Description', 'Amount'],
-            ['Present Days', str(present_days)],
-            ['Gross Salary', f"₹{gross_salary:.2f}"],
-            ['Total Advance', f"₹{total_advance:.2f}"],
-            ['Net Salary', f"₹{net_salary:.2f}"]
-        ]
-        
-        summary_table = Table(summary_data, colWidths=[3*inch, 3*inch])
-        summary_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4472C4')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#E7E6E6')),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(summary_table)
-        
-        doc.build(elements)
+        exports.render_employee_report(report, output)
         output.seek(0)
         
         return send_file(output, mimetype='application/pdf', as_attachment=True,
-                        download_name=f'employee_report_{employee["name"]}_{start_date}.pdf')
+                        download_name=f'employee_report_{report.employee["name"]}_{report.start_date}.pdf')
 
+    @app.route('/wage_simulator', methods=['GET', 'POST'])
+    @query_budget(3)
+    def wage_simulator_view():
+        """Cost out wage revision scenarios over the last N months"""
+        import wage_simulator  # pulls in NumPy; only this page needs it
+        
+        months = request.values.get('months', 12, type=int)
+        text = request.values.get('scenarios', 'Mason +8%, Helper +50/day')
+        months = min(max(months or 12, 1), 60)
+        
+        roster = wage_simulator.load_roster(months)
+        if roster is None:
+            flash('Error loading employee data!', 'error')
+            return redirect(url_for('dashboard'))
+        
+        scenarios = [(f'Scenario {i}', line.strip())
+                     for i, line in enumerate(text.splitlines(), start=1) if line.strip()]
+        results, errors = wage_simulator.simulate(roster, scenarios)
+        for error in errors:
+            flash(error, 'error')
+        return render_template('wage_simulator.html', roster=roster, months=months,
+                               scenarios=text, results=results)
+    
     @app.route('/all_employees_summary')
+    @query_budget(3)
     def all_employees_summary():
         """Summary report of all employees"""
         
@@ -836,24 +639,5 @@ def init_routes(app):
         month = request.args.get('month', f'{datetime.now().month:02d}')
         year = request.args.get('year', str(datetime.now().year))
         
-        employees = Employee.get_all()
-        employee_summaries = []
-        
-        for emp in employees:
-            present_days = Attendance.get_month_attendance(emp['id'], month, year)
-            gross_salary = present_days * emp['daily_salary']
-            total_advance = Advance.get_month_advance(emp['id'], month, year)
-            net_salary = float(gross_salary) - float(total_advance)
-            
-            employee_summaries.append({
-                'employee': emp,
-                'present_days': present_days,
-                'gross_salary': float(gross_salary),
-                'total_advance': float(total_advance),
-                'net_salary': net_salary
-            })
-        
-        return render_template('all_employees_summary.html',
-                            employee_summaries=employee_summaries,
-                            month=month,
-                            year=year)
\ No newline at end of file
+        result = payroll.monthly_payroll(month, year)
+        return result.render('html', template='all_employees_summary.html', month=month, year=year)
@@ -0,0 +1,179 @@
+"""
+Bulk material bill and expense ingestion for a site
+
+The spreadsheet (CSV or XLSX) needs a header row; column order does not
+matter. Material bills name their category (e.g. "Cement") rather than its
+id. Every row is validated first and the batch is inserted in one
+transaction only if all rows are valid.
+
+Materials:  category, material_name, quantity, unit, rate_per_unit, sent_date,
+            [supplier_name], [bill_number], [notes]
+Expenses:   expense_date, expense_type, amount,
+            [description], [paid_to], [payment_mode]
+
+Usage:
+    python site_import.py materials SITE_ID bills.xlsx
+    python site_import.py expenses SITE_ID expenses.csv
+"""
+
+from decimal import Decimal, InvalidOperation
+import sys
+
+from psycopg2.extras import execute_values
+
+from attendance_import import read_rows, parse_date
+from database import get_db
+from models import MaterialCategory, bump_version
+
+MATERIAL_COLUMNS = ['category', 'material_name', 'quantity', 'unit', 'rate_per_unit', 'sent_date']
+EXPENSE_COLUMNS = ['expense_date', 'expense_type', 'amount']
+BATCH_SIZE = 1000
+
+def category_ids():
+    """Lower-cased category name -> id.
+
+    Not cached: categories are added directly in the database, with no
+    write path that would bump a data version.
+    """
+    return {c['category_name'].strip().lower(): c['id'] for c in MaterialCategory.get_all()}
+
+def _decimal(value, name):
+    try:
+        number = Decimal(str(value).strip())
+    except (InvalidOperation, TypeError):
+        raise ValueError(f'bad {name} {value!r}')
+    if not number.is_finite() or number < 0:
+        raise ValueError(f'bad {name} {value!r}')
+    return number
+
+def _text(value):
+    return str(value).strip() if value not in (None, '') else ''
+
+def _header(rows, required):
+    names = [str(h or '').strip().lower() for h in next(rows, [])]
+    missing = [c for c in required if c not in names]
+    if missing:
+        raise ValueError(f"missing columns: {', '.join(missing)}")
+    return {name: i for i, name in enumerate(names)}
+
+def _records(rows, required, parse):
+    """Parse every data row; returns (records, errors) with 1-based line numbers"""
+    rows = iter(rows)
+    columns = _header(rows, required)
+    records, errors = [], []
+    for line, row in enumerate(rows, start=2):
+        if not row or all(cell in (None, '') for cell in row):
+            continue
+        cell = lambda name: row[columns[name]] if name in columns and columns[name] < len(row) else None
+        try:
+            records.append(parse(cell))
+        except ValueError as e:
+            errors.append(f'line {line}: {e}')
+    return records, errors
+
+def parse_materials(rows, site_id):
+    categories = category_ids()
+
+    def parse(cell):
+        category = _text(cell('category'))
+        category_id = categories.get(category.lower())
+        if category_id is None:
+            raise ValueError(f'unknown category {category!r}')
+        if not _text(cell('material_name')) or not _text(cell('unit')):
+            raise ValueError('material_name and unit are required')
+        return (site_id, category_id, _text(cell('material_name')),
+                _decimal(cell('quantity'), 'quantity'), _text(cell('unit')),
+                _decimal(cell('rate_per_unit'), 'rate_per_unit'),
+                _text(cell('supplier_name')), parse_date(cell('sent_date')),
+                _text(cell('bill_number')), _text(cell('notes')))
+
+    return _records(rows, MATERIAL_COLUMNS, parse)
+
+def parse_expenses(rows, site_id):
+    def parse(cell):
+        if not _text(cell('expense_type')):
+            raise ValueError('expense_type is required')
+        return (site_id, parse_date(cell('expense_date')), _text(cell('expense_type')),
+                _text(cell('description')), _decimal(cell('amount'), 'amount'),
+                _text(cell('paid_to')), _text(cell('payment_mode')))
+
+    return _records(rows, EXPENSE_COLUMNS, parse)
+
+def _insert(records, sql, template, tables):
+    conn = get_db()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    try:
+        execute_values(cursor, sql, records, template=template, page_size=BATCH_SIZE)
+        bump_version(cursor, *tables)
+        conn.commit()
+        return len(records)
+    except Exception as e:
+        print("site_import error:", e)
+        conn.rollback()
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def import_materials(fileobj, filename, site_id):
+    """Returns (inserted count or None on database error, errors)"""
+    records, errors = parse_materials(read_rows(fileobj, filename), site_id)
+    if errors or not records:
+        return 0, errors
+    # total_cost and amount_balance are computed by the INSERT itself
+    inserted = _insert(records, '''
+        INSERT INTO site_materials
+            (site_id, material_category_id, material_name, quantity, unit,
+             rate_per_unit, total_cost, supplier_name, sent_date, bill_number,
+             amount_balance, notes)
+        SELECT v.site_id, v.category_id, v.material_name, v.quantity, v.unit,
+            v.rate, v.quantity * v.rate, v.supplier_name, v.sent_date, v.bill_number,
+            v.quantity * v.rate, v.notes
+        FROM (VALUES %s) AS v (site_id, category_id, material_name, quantity, unit,
+                               rate, supplier_name, sent_date, bill_number, notes)
+    ''', '(%s, %s, %s, %s::numeric, %s, %s::numeric, %s, %s::date, %s, %s)', ('site_materials',))
+    return inserted, []
+
+def import_expenses(fileobj, filename, site_id):
+    """Returns (inserted count or None on database error, errors)"""
+    records, errors = parse_expenses(read_rows(fileobj, filename), site_id)
+    if errors or not records:
+        return 0, errors
+    inserted = _insert(records, '''
+        INSERT INTO site_expenses
+            (site_id, expense_date, expense_type, description, amount, paid_to, payment_mode)
+        VALUES %s
+    ''', None, ('site_expenses',))
+    return inserted, []
+
+IMPORTERS = {'materials': import_materials, 'expenses': import_expenses}
+
+def main(argv):
+    if len(argv) != 4 or argv[1] not in IMPORTERS:
+        print(__doc__.strip())
+        return 1
+
+    kind, site_id, path = argv[1], int(argv[2]), argv[3]
+    print(f"🔄 Importing {kind} for site {site_id} from {path}...")
+    with open(path, 'rb') as f:
+        try:
+            inserted, errors = IMPORTERS[kind](f, path, site_id)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+
+    for error in errors:
+        print(f"  {error}")
+    if errors:
+        print(f"❌ {len(errors)} invalid row(s); nothing was imported")
+        return 1
+    if inserted is None:
+        print("❌ Import failed!")
+        return 1
+    print(f"✅ Imported {inserted} row(s)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
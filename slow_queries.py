@@ -0,0 +1,143 @@
+"""
+Slow-statement log with sampled EXPLAIN plans
+
+Any statement slower than SLOW_QUERY_MS is recorded with its parameters,
+the route that ran it and the model method that issued it, in a ring
+buffer of the last SLOW_QUERY_LOG_SIZE entries (per process). A sample
+(SLOW_QUERY_EXPLAIN_RATE) of slow SELECTs is re-run under
+``EXPLAIN (ANALYZE, BUFFERS)`` on a separate read-only connection by a
+background thread, so the request that hit it is not slowed further.
+"""
+
+from collections import deque
+from datetime import datetime
+import os
+import queue
+import random
+import sys
+import threading
+
+from flask import has_request_context, request
+
+from database import add_query_listener, connect
+
+THRESHOLD = float(os.environ.get('SLOW_QUERY_MS', 200)) / 1000
+EXPLAIN_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', 0.1))
+LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', 100))
+EXPLAIN_TIMEOUT_MS = int(os.environ.get('SLOW_QUERY_EXPLAIN_TIMEOUT_MS', 30000))
+
+# Frames from these modules are plumbing, not the caller worth reporting
+_SKIP_MODULES = {__name__, 'database', 'metrics', 'query_check', 'psycopg2', 'psycopg2.extras'}
+
+def _caller():
+    """'module.Class.method' of the innermost frame outside the database layer"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module not in _SKIP_MODULES:
+            code = frame.f_code
+            return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+        frame = frame.f_back
+    return None
+
+def _is_select(sql):
+    words = sql.lstrip().split(None, 1)
+    if not words:
+        return False
+    if words[0].lower() == 'select':
+        return True
+    # A WITH query may hide a data-modifying CTE; only plan plain reads
+    lowered = sql.lower()
+    return words[0].lower() == 'with' and not any(
+        verb in lowered for verb in ('insert ', 'update ', 'delete '))
+
+class SlowQueryLog:
+    def __init__(self, threshold, explain_rate, size):
+        self.threshold = threshold
+        self.explain_rate = explain_rate
+        self.entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pending = queue.Queue(maxsize=10)
+        self._worker = None
+
+    def install(self):
+        """Start recording statements from every traced connection"""
+        add_query_listener(self.record)
+
+    def record(self, sql, params, seconds):
+        if seconds < self.threshold or getattr(self._local, 'explaining', False):
+            return
+        if isinstance(sql, bytes):
+            sql = sql.decode('utf-8', 'replace')
+        sql = str(sql)
+        entry = {
+            'at': datetime.now(),
+            'ms': seconds * 1000,
+            'sql': ' '.join(sql.split()),
+            'params': repr(params)[:500] if params is not None else '',
+            'route': f'{request.method} {request.path}' if has_request_context() else None,
+            'endpoint': request.endpoint if has_request_context() else None,
+            'caller': _caller(),
+            'plan': None
+        }
+        with self._lock:
+            self.entries.append(entry)
+        if _is_select(sql) and random.random() < self.explain_rate:
+            self._queue_explain(entry, sql, params)
+
+    def _queue_explain(self, entry, sql, params):
+        entry['plan'] = 'EXPLAIN pending...'
+        try:
+            self._pending.put_nowait((entry, sql, params))
+        except queue.Full:
+            entry['plan'] = None
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._explain_loop, daemon=True,
+                                                name='slow-query-explain')
+                self._worker.start()
+
+    def _explain_loop(self):
+        self._local.explaining = True
+        while True:
+            entry, sql, params = self._pending.get()
+            entry['plan'] = self.explain(sql, params)
+
+    def explain(self, sql, params):
+        """EXPLAIN (ANALYZE, BUFFERS) output for a read-only statement"""
+        try:
+            conn = connect()
+        except Exception as e:
+            return f'EXPLAIN failed: cannot connect ({e})'
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SET TRANSACTION READ ONLY')
+            cursor.execute('SET LOCAL statement_timeout = %s', (EXPLAIN_TIMEOUT_MS,))
+            cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+        except Exception as e:
+            return f'EXPLAIN failed: {e}'
+        finally:
+            cursor.close()
+            conn.rollback()
+            conn.close()
+
+    def recent(self):
+        """Logged statements, newest first"""
+        with self._lock:
+            return list(reversed(self.entries))
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def reset_after_fork(self):
+        """Forget the parent's entries and explain thread"""
+        self.entries = deque(maxlen=self.entries.maxlen)
+        self._lock = threading.Lock()
+        self._pending = queue.Queue(maxsize=10)
+        self._worker = None
+
+slow_query_log = SlowQueryLog(THRESHOLD, EXPLAIN_RATE, LOG_SIZE)
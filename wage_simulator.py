@@ -0,0 +1,184 @@
+"""
+What-if payroll simulator for wage revisions
+
+The roster's present days and advances over a trailing window are loaded
+into NumPy arrays once (from employee_month_summary) and cached. Each
+scenario is a list of rate rules applied as vectorized operations, so dozens
+of scenarios cost a few milliseconds.
+
+A scenario is written as comma-separated rules, applied in order:
+
+    Mason +8%, Helper +50/day, #12 -20
+
+The target is a role name or ``#<employee id>``. An amount ending in ``%``
+changes the rate by that percentage; anything else is rupees per day.
+"""
+
+from dataclasses import dataclass
+from datetime import date
+import re
+
+import numpy as np
+
+from database import get_db
+from report_cache import report_cache
+
+# The rollup's own version only moves on a rebuild; triggers keep it in step
+# with attendance and advances, so key on those as payroll.MONTHLY_TABLES does
+ROSTER_TABLES = ('employees', 'attendance', 'advances', 'employee_month_summary')
+RULE_PATTERN = re.compile(
+    r'^(?P<target>.+?)\s*(?P<sign>[+-])\s*₹?(?P<amount>\d+(?:\.\d+)?)\s*(?P<unit>%|/day)?$')
+
+@dataclass
+class Rule:
+    role: str = None
+    employee_id: int = None
+    percent: float = 0.0
+    per_day: float = 0.0
+
+def parse_scenario(text):
+    """Parse 'Mason +8%, Helper +50/day' into Rules; raises ValueError"""
+    rules = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        match = RULE_PATTERN.match(part)
+        if not match:
+            raise ValueError(f'cannot read rule {part!r}')
+        amount = float(match['amount']) * (-1 if match['sign'] == '-' else 1)
+        target = match['target'].strip()
+        rule = Rule(percent=amount if match['unit'] == '%' else 0.0,
+                    per_day=0.0 if match['unit'] == '%' else amount)
+        if target.startswith('#'):
+            try:
+                rule.employee_id = int(target[1:])
+            except ValueError:
+                raise ValueError(f'bad employee id in {part!r}')
+        else:
+            rule.role = target
+        rules.append(rule)
+    if not rules:
+        raise ValueError('scenario has no rules')
+    return rules
+
+class Roster:
+    """Employees as parallel arrays, plus their role grouping"""
+
+    def __init__(self, start, end, rows):
+        self.start = start
+        self.end = end
+        self.ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.names = [r[1] for r in rows]
+        self.roles = np.array([r[2] for r in rows], dtype=object)
+        self.rates = np.array([float(r[3]) for r in rows], dtype=np.float64)
+        self.present_days = np.array([r[4] for r in rows], dtype=np.float64)
+        self.advances = np.array([float(r[5]) for r in rows], dtype=np.float64)
+        self.role_keys = np.array([str(r).strip().lower() for r in self.roles], dtype=object)
+        self.role_names, self.role_index = np.unique(self.roles.astype(str), return_inverse=True)
+        self.baseline = self.rates * self.present_days
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rates_for(self, rules):
+        """New daily rate per employee after applying rules in order.
+
+        Roles match case-insensitively; raises ValueError if a rule matches
+        nobody.
+        """
+        rates = self.rates.copy()
+        for rule in rules:
+            if rule.employee_id is not None:
+                mask = self.ids == rule.employee_id
+                target = f'#{rule.employee_id}'
+            else:
+                mask = self.role_keys == rule.role.lower()
+                target = rule.role
+            if not mask.any():
+                raise ValueError(f'no employee matches {target!r}')
+            rates[mask] = rates[mask] * (1 + rule.percent / 100) + rule.per_day
+        return np.round(rates, 2)
+
+    def simulate(self, name, rules):
+        """Per-employee and per-role cost deltas for one scenario"""
+        rates = self.rates_for(rules)
+        cost = rates * self.present_days
+        delta = cost - self.baseline
+        role_baseline = np.bincount(self.role_index, weights=self.baseline,
+                                    minlength=len(self.role_names))
+        role_delta = np.bincount(self.role_index, weights=delta, minlength=len(self.role_names))
+
+        changed = np.nonzero(rates != self.rates)[0]
+        employees = zip(self.ids[changed].tolist(), self.roles[changed].tolist(),
+                        self.rates[changed].tolist(), rates[changed].tolist(),
+                        self.present_days[changed].tolist(), delta[changed].tolist(),
+                        changed.tolist())
+        baseline_total = float(self.baseline.sum())
+        delta_total = float(delta.sum())
+        return {
+            'name': name,
+            'baseline_cost': baseline_total,
+            'new_cost': baseline_total + delta_total,
+            'delta': delta_total,
+            'delta_percent': delta_total / baseline_total * 100 if baseline_total else 0.0,
+            'roles': [{'role': role, 'baseline_cost': float(base), 'delta': float(d)}
+                      for role, base, d in zip(self.role_names, role_baseline, role_delta)
+                      if d or base],
+            'employees': [{'id': emp_id, 'name': self.names[i], 'role': role,
+                           'old_rate': old_rate, 'new_rate': new_rate,
+                           'present_days': int(days), 'delta': d}
+                          for emp_id, role, old_rate, new_rate, days, d, i in employees]
+        }
+
+def window(months, today=None):
+    """[start, end) covering the last ``months`` whole calendar months"""
+    today = today or date.today()
+    end = date(today.year, today.month, 1)
+    index = today.year * 12 + today.month - 1 - months
+    start = date(index // 12, index % 12 + 1, 1)
+    return start, end
+
+def _load_rows(start, end):
+    conn = get_db()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            SELECT e.id, e.name, e.role, e.daily_salary,
+                COALESCE(SUM(s.present_days), 0) AS present_days,
+                COALESCE(SUM(s.total_advance), 0) AS total_advance
+            FROM employees e
+            LEFT JOIN employee_month_summary s
+                ON s.employee_id = e.id AND s.month >= %s AND s.month < %s
+            GROUP BY e.id
+            ORDER BY e.id
+        ''', (start, end))
+        return cursor.fetchall()
+    except Exception as e:
+        print("wage_simulator load error:", e)
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def load_roster(months=12):
+    """Cached Roster for the trailing window, or None on error"""
+    start, end = window(months)
+
+    def load():
+        rows = _load_rows(start, end)
+        return Roster(start, end, rows) if rows is not None else None
+
+    return report_cache.get_or_load('wage_roster', (start, end), ROSTER_TABLES, load)
+
+def simulate(roster, scenarios):
+    """Run (name, text) scenarios; returns (results, errors)"""
+    results, errors = [], []
+    for name, text in scenarios:
+        try:
+            results.append(roster.simulate(name, parse_scenario(text)))
+        except ValueError as e:
+            errors.append(f'{name}: {e}')
+    return results, errors